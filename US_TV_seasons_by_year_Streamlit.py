@@ -1,11 +1,17 @@
 import streamlit as st
 import pandas as pd
 # import numpy as np
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.statespace.sarimax import SARIMAX
+from arima_selection import (
+    NO_SEASON,
+    best_order,
+    grid_by_criterion,
+    grid_search,
+    stepwise_search,
+    validate_top,
+)
+from model_cache import load_or_fit
 # from pmdarima import auto_arima
-from sklearn.metrics import mean_squared_error
-from math import sqrt
+import time
 import warnings
 # from sklearn.preprocessing import PolynomialFeatures
 # from sklearn.linear_model import Ridge
@@ -111,71 +117,164 @@ st.write(df)
 years_ahead = st.slider("Select number of years to project into the future:", 1, 15, 5)
 
 
-@st.cache_data
-def evaluate_arima_model(X, arima_order):
-    # Prepare training dataset
-    train_size = int(len(X) * 0.66)
-    train, test = X[0:train_size], X[train_size:]
-    history = [x for x in train]
-    # Make predictions
-    predictions = []
-    for t in range(len(test)):
-        model = ARIMA(history, order=arima_order)
-        model_fit = model.fit()
-        yhat = model_fit.forecast()[0]
-        predictions.append(yhat)
-        history.append(test[t])
-    # Ensure predictions are non-negative
-    predictions = [
-        max(0, yhat) for yhat in predictions
-    ]  # Ensure no negative predictions
-    # Calculate out of sample error
-    rmse = sqrt(mean_squared_error(test, predictions))
-    return rmse
-
-
-@st.cache_data
-def evaluate_models(dataset, p_values, d_values, q_values):
+# Persisted so a server restart does not repeat the search for the same data
+@st.cache_data(persist="disk")
+def evaluate_models(dataset, p_values, d_values, q_values, refit_every):
+    start = time.perf_counter()
     dataset = dataset.astype(float)
-    best_score, best_cfg = float("inf"), None
-    total_combinations = len(p_values) * len(d_values) * len(q_values)
+    orders = [(p, d, q) for p in p_values for d in d_values for q in q_values]
 
     progress_bar = st.progress(0)
     status_text = st.empty()
 
-    for i, p in enumerate(p_values):
-        for d in d_values:
-            for q in q_values:
-                order = (p, d, q)
-                try:
-                    rmse = evaluate_arima_model(dataset, order)
-                    if rmse < best_score:
-                        best_score, best_cfg = rmse, order
-                    status_text.text(f"ARIMA{order} RMSE={rmse:.3f}")
-                except:
-                    continue
-                progress = (
-                    i * len(d_values) * len(q_values) + d * len(q_values) + q + 1
-                ) / total_combinations
-                progress_bar.progress(progress)
-
-    status_text.text(f"Best ARIMA{best_cfg} RMSE={best_score:.3f}")
-    return best_cfg
+    # Orders are walk-forward evaluated in parallel and reported as they finish
+    def report(order, status, rmse, done, total):
+        if status == "done":
+            status_text.text(f"ARIMA{order} RMSE={rmse:.3f}")
+        elif status == "abandoned":
+            status_text.text(f"ARIMA{order} abandoned, already worse than the best")
+        progress_bar.progress(done / total)
 
+    results = grid_search(dataset, orders, on_result=report, refit_every=refit_every)
+    best_cfg, best_score = best_order(results)
+
+    abandoned = sum(status == "abandoned" for status, _ in results.values())
+    status_text.text(
+        f"Best ARIMA{best_cfg} RMSE={best_score:.3f} ({abandoned} of {len(orders)} orders abandoned early)"
+    )
+    return {
+        "order": best_cfg,
+        "seasonal_order": NO_SEASON,
+        "rmse": best_score,
+        "models": len(orders),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# Ranks orders by AIC or BIC from one fit each, then walk-forward validates
+# only the top_k of them. None if no ranked model survives validation
+@st.cache_data(persist="disk")
+def select_by_criterion(
+    dataset,
+    criterion,
+    stepwise,
+    seasonal_period,
+    p_values,
+    d_values,
+    q_values,
+    top_k,
+    refit_every,
+):
+    start = time.perf_counter()
+    dataset = dataset.astype(float)
+    if stepwise:
+        ranked = stepwise_search(dataset, criterion, seasonal_period=seasonal_period)
+    else:
+        # ICs are only comparable for a single d, so d is fixed first
+        ranked = grid_by_criterion(dataset, p_values, d_values, q_values, criterion)
+    validated = validate_top(dataset, ranked, top_k, refit_every)
+    if not validated:
+        return None
+    order, seasonal_order, rmse = validated[0]
+    st.text(
+        f"Best ARIMA{order}{seasonal_order if seasonal_order != NO_SEASON else ''} "
+        f"RMSE={rmse:.3f} (top {top_k} of {len(ranked)} models by {criterion.upper()})"
+    )
+    return {
+        "order": order,
+        "seasonal_order": seasonal_order,
+        "rmse": rmse,
+        "models": len(ranked),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# Fitted results come from the on-disk model cache, and stay in memory so
+# moving the horizon slider only calls forecast
+@st.cache_resource
+def fitted_model(series, order, model_type, seasonal_order):
+    return load_or_fit(series, order, model_type, seasonal_order=seasonal_order)
+
+
+# Order selection method
+selection_methods = {
+    "Walk-forward RMSE (exhaustive)": None,
+    "AIC": "aic",
+    "BIC": "bic",
+}
+method = st.radio("Select ARIMA orders by:", list(selection_methods), horizontal=True)
+criterion = selection_methods[method]
+if criterion:
+    stepwise = st.checkbox(
+        "Stepwise search (p and q up to 5, d up to 2, optional seasonal terms)",
+        value=True,
+    )
+    seasonal_period = st.number_input(
+        "Seasonal period in years (0 for none):", 0, 20, 0, disabled=not stepwise
+    )
+    compare = st.checkbox("Compare with the exhaustive walk-forward search")
 
 # Evaluate parameters
 with st.spinner("Evaluating ARIMA models..."):
-    p_values = [0, 1, 2]  # Reduced parameter space
+    p_values = range(0, 4)
     d_values = range(0, 2)
-    q_values = range(0, 2)
+    q_values = range(0, 3)
+    # Walk-forward steps between parameter refits; the steps in between only
+    # update the fitted model with the new observation
+    refit_every = 10
+    # Candidates ranked by AIC/BIC that get a walk-forward validation
+    top_k = 3
     warnings.filterwarnings("ignore")
-    best_order = evaluate_models(
-        df["Number of Seasons"].values, p_values, d_values, q_values
+    selection = None
+    if criterion:
+        selection = select_by_criterion(
+            df["Number of Seasons"].values,
+            criterion,
+            stepwise,
+            seasonal_period if stepwise else 0,
+            p_values,
+            d_values,
+            q_values,
+            top_k,
+            refit_every,
+        )
+        if selection is None:
+            st.warning(
+                f"No model ranked by {criterion.upper()} could be validated; "
+                "using the exhaustive walk-forward search instead."
+            )
+    if selection is None or compare:
+        exhaustive = evaluate_models(
+            df["Number of Seasons"].values, p_values, d_values, q_values, refit_every
+        )
+    if selection is None:
+        selection = exhaustive
+    chosen_order = selection["order"]
+    seasonal_order = selection["seasonal_order"]
+
+# Timing and chosen order of both methods
+if criterion and compare and selection is not exhaustive:
+    st.subheader("Order Selection Comparison")
+    comparison = pd.DataFrame(
+        [selection, exhaustive],
+        index=[method, "Walk-forward RMSE (exhaustive)"],
+    )
+    comparison["order"] = comparison["order"].astype(str)
+    comparison["seasonal_order"] = comparison["seasonal_order"].astype(str)
+    st.write(
+        comparison.rename(
+            columns={
+                "order": "Order",
+                "seasonal_order": "Seasonal order",
+                "rmse": "RMSE",
+                "models": "Models",
+                "seconds": "Search time (s)",
+            }
+        )
     )
 
 # Fit the ARIMA model
-model = ARIMA(df["Number of Seasons"], order=best_order)
-results = model.fit()
+results = fitted_model(df["Number of Seasons"], chosen_order, "ARIMA", seasonal_order)
 
 # Make future predictions using ARIMA
 forecast = results.forecast(steps=years_ahead)
@@ -198,8 +297,9 @@ st.text(results.summary())
 
 # Make future predictions using another time series model (e.g., SARIMAX)
 # Replace the polynomial regression model with SARIMAX
-model_sarimax = SARIMAX(df["Number of Seasons"], order=best_order)
-results_sarimax = model_sarimax.fit()
+results_sarimax = fitted_model(
+    df["Number of Seasons"], chosen_order, "SARIMAX", seasonal_order
+)
 
 # Make future predictions using SARIMAX
 forecast_sarimax = results_sarimax.forecast(steps=years_ahead)
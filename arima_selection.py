@@ -0,0 +1,269 @@
+# ARIMA order selection for US_TV_seasons_by_year_Streamlit.py. Orders are
+# evaluated in worker processes, so the code they run lives in this
+# importable module rather than in the Streamlit script.
+
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from math import sqrt
+
+import numpy as np
+from statsmodels.tsa.arima.model import ARIMA
+
+from budget.worker_processes import app_script_not_rerun, forkserver_context
+
+TRAIN_FRACTION = 0.66
+NO_SEASON = (0, 0, 0, 0)
+KPSS_ALPHA = 0.05  # Difference while KPSS rejects stationarity at this level
+# Stepwise starting points as (p, q, P, Q), as in Hyndman & Khandakar (2008)
+STEPWISE_STARTS = [(2, 2, 1, 1), (0, 0, 0, 0), (1, 0, 1, 0), (0, 1, 0, 1)]
+
+# Best RMSE found so far by any worker, shared through _init_worker
+_best_rmse = None
+
+
+def walk_forward_rmse(
+    X, order, abandon_above=None, refit_every=None, seasonal_order=NO_SEASON
+):
+    # One-step-ahead forecasts over the test window, clipped at zero. The
+    # model is fitted once on the training window; each new observation is
+    # then folded in with results.extend (one Kalman filter step with the
+    # fitted parameters) instead of a full refit. With refit_every=k the
+    # parameters are re-estimated on the whole history every k steps,
+    # warm-started from the current ones.
+    # Returns None as soon as the error so far already guarantees an RMSE
+    # above abandon_above(): squared errors only add up, so
+    # sqrt(partial SSE / len(test)) is a lower bound on the final RMSE
+    X = np.asarray(X, dtype=float)
+    train_size = int(len(X) * TRAIN_FRACTION)
+    test = X[train_size:]
+    results = ARIMA(X[0:train_size], order=order, seasonal_order=seasonal_order).fit()
+    sse = 0.0
+    for t in range(len(test)):
+        yhat = results.forecast()[0]
+        sse += (test[t] - max(0, yhat)) ** 2
+        if abandon_above is not None and sqrt(sse / len(test)) > abandon_above():
+            return None
+        if refit_every and (t + 1) % refit_every == 0:
+            results = ARIMA(
+                X[0 : train_size + t + 1], order=order, seasonal_order=seasonal_order
+            ).fit(start_params=results.params)
+        else:
+            results = results.extend(test[t : t + 1])
+    return sqrt(sse / len(test))
+
+
+def _init_worker(best_rmse):
+    global _best_rmse
+    _best_rmse = best_rmse
+    warnings.filterwarnings("ignore")
+
+
+def _evaluate_order(X, order, refit_every):
+    try:
+        rmse = walk_forward_rmse(
+            X, order, abandon_above=lambda: _best_rmse.value, refit_every=refit_every
+        )
+    except Exception:
+        return "failed", None
+    if rmse is None:
+        return "abandoned", None
+    with _best_rmse.get_lock():
+        _best_rmse.value = min(_best_rmse.value, rmse)
+    return "done", rmse
+
+
+def grid_search(X, orders, max_workers=None, on_result=None, refit_every=None):
+    # Walk-forward RMSE of every order, fanned out over a process pool.
+    # on_result(order, status, rmse, done, total) is called in the calling
+    # thread as each order finishes; status is "done", "abandoned" (its
+    # partial RMSE already exceeded the best) or "failed" (the fit raised)
+    # Preloading this module also preloads statsmodels
+    context = forkserver_context(["arima_selection"])
+    best_rmse = context.Value("d", float("inf"))
+    # Low orders fit fastest and set an early bound for the rest
+    orders = sorted(orders, key=sum)
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(best_rmse,),
+    ) as executor:
+        with app_script_not_rerun():
+            futures = {
+                executor.submit(_evaluate_order, X, order, refit_every): order
+                for order in orders
+            }
+        for done, future in enumerate(as_completed(futures), start=1):
+            order = futures[future]
+            status, rmse = future.result()
+            results[order] = (status, rmse)
+            if on_result is not None:
+                on_result(order, status, rmse, done, len(orders))
+    return results
+
+
+def select_order(X, orders, refit_every=None):
+    # Serial grid_search, for callers that already spread whole series over
+    # a process pool. Same statuses and the same early abandonment, with the
+    # bound kept locally
+    best_rmse = float("inf")
+    results = {}
+    for order in sorted(orders, key=sum):
+        try:
+            rmse = walk_forward_rmse(
+                X, order, abandon_above=lambda: best_rmse, refit_every=refit_every
+            )
+        except Exception:
+            results[order] = ("failed", None)
+            continue
+        if rmse is None:
+            results[order] = ("abandoned", None)
+            continue
+        best_rmse = min(best_rmse, rmse)
+        results[order] = ("done", rmse)
+    return results
+
+
+def best_order(results):
+    # (order, rmse) with the lowest RMSE among completed orders
+    scored = {
+        order: rmse for order, (status, rmse) in results.items() if status == "done"
+    }
+    order = min(scored, key=scored.get)
+    return order, scored[order]
+
+
+def information_criterion(X, order, seasonal_order=NO_SEASON, criterion="aic"):
+    # AIC or BIC of a single fit on the whole series; inf if the fit fails
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            results = ARIMA(X, order=order, seasonal_order=seasonal_order).fit()
+    except Exception:
+        return float("inf")
+    value = getattr(results, criterion)
+    return value if np.isfinite(value) else float("inf")
+
+
+def rank_by_criterion(X, candidates, criterion="aic"):
+    # [(order, seasonal_order, criterion)] for (order, seasonal_order)
+    # candidates, best first
+    X = np.asarray(X, dtype=float)
+    scored = [
+        (order, seasonal_order, information_criterion(X, order, seasonal_order, criterion))
+        for order, seasonal_order in candidates
+    ]
+    return sorted(scored, key=lambda row: row[2])
+
+
+def differencing_order(X, max_d):
+    # Number of differences until the KPSS test no longer rejects level
+    # stationarity. ICs are not comparable across d, so d is fixed up front
+    from statsmodels.tsa.stattools import kpss
+
+    X = np.asarray(X, dtype=float)
+    d = 0
+    while d < max_d and len(X) > 3:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # p-values outside the lookup table
+            pvalue = kpss(X, regression="c", nlags="auto")[1]
+        if pvalue >= KPSS_ALPHA:
+            break
+        X = np.diff(X)
+        d += 1
+    return d
+
+
+def grid_by_criterion(X, p_values, d_values, q_values, criterion="aic"):
+    # Exhaustive counterpart of stepwise_search: d is fixed with KPSS (within
+    # d_values) and every (p, q) with that d is ranked like rank_by_criterion
+    d = max(min(d_values), differencing_order(X, max(d_values)))
+    candidates = [((p, d, q), NO_SEASON) for p in p_values for q in q_values]
+    return rank_by_criterion(X, candidates, criterion)
+
+
+def stepwise_search(
+    X,
+    criterion="aic",
+    max_p=5,
+    max_d=2,
+    max_q=5,
+    seasonal_period=0,
+    max_P=2,
+    seasonal_d=0,
+    max_Q=2,
+):
+    # Hyndman-Khandakar stepwise search: fix d with KPSS, fit a few starting
+    # models, then move to whichever neighbour (one of p, q, P, Q changed by
+    # one, or p and q together) improves the criterion until none does.
+    # Returns every model fitted, ranked like rank_by_criterion
+    X = np.asarray(X, dtype=float)
+    d = differencing_order(X, max_d)
+    seasonal = seasonal_period > 1
+    scores = {}
+
+    def seasonal_order(P, Q):
+        if seasonal and (P or Q or seasonal_d):
+            return (P, seasonal_d, Q, seasonal_period)
+        return NO_SEASON
+
+    def score(p, q, P, Q):
+        if not (0 <= p <= max_p and 0 <= q <= max_q):
+            return float("inf")
+        if not (0 <= P <= max_P and 0 <= Q <= max_Q):
+            return float("inf")
+        if not seasonal:
+            P = Q = 0
+        if (p, q, P, Q) not in scores:
+            scores[(p, q, P, Q)] = information_criterion(
+                X, (p, d, q), seasonal_order(P, Q), criterion
+            )
+        return scores[(p, q, P, Q)]
+
+    for start in STEPWISE_STARTS:
+        score(*start)
+    current = min(scores, key=scores.get)
+    while True:
+        p, q, P, Q = current
+        steps = [(1, 0, 0, 0), (0, 1, 0, 0), (1, 1, 0, 0)]
+        if seasonal:
+            steps += [(0, 0, 1, 0), (0, 0, 0, 1)]
+        neighbours = [
+            (p + sign * dp, q + sign * dq, P + sign * dP, Q + sign * dQ)
+            for dp, dq, dP, dQ in steps
+            for sign in (1, -1)
+        ]
+        best = min(neighbours, key=lambda n: score(*n))
+        if score(*best) >= scores[current]:
+            break
+        current = best
+
+    return sorted(
+        (
+            ((p, d, q), seasonal_order(P, Q), value)
+            for (p, q, P, Q), value in scores.items()
+        ),
+        key=lambda row: row[2],
+    )
+
+
+def validate_top(X, ranked, top_k=3, refit_every=None):
+    # Walk-forward RMSE of the top_k models in a ranking, as
+    # (order, seasonal_order, rmse) with the lowest RMSE first. A candidate
+    # whose walk-forward fit fails is replaced by the next one in the
+    # ranking; empty only if every candidate fails
+    validated = []
+    for order, seasonal_order, _ in ranked:
+        if len(validated) == top_k:
+            break
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                rmse = walk_forward_rmse(
+                    X, order, refit_every=refit_every, seasonal_order=seasonal_order
+                )
+        except Exception:
+            continue
+        validated.append((order, seasonal_order, rmse))
+    return sorted(validated, key=lambda row: row[2])
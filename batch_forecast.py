@@ -0,0 +1,166 @@
+"""Headless batch forecasting with the TV seasons ARIMA/SARIMAX pipeline.
+
+Reads many series from one long-format table (one row per series and
+period), selects each series' ARIMA order by walk-forward RMSE, fits ARIMA
+and SARIMAX with that order and writes the forecasts to an output table.
+Series are spread over a process pool, one series per task:
+
+    python batch_forecast.py series.parquet forecasts.parquet
+    python batch_forecast.py series.csv forecasts.csv --horizon 10 --workers 8
+
+Input and output formats follow the file extension (.parquet or .csv). The
+output has one row per series and forecast step, with the chosen order and
+its RMSE; series that cannot be modelled get a single row with an error.
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from arima_selection import best_order, select_order
+from model_cache import MODEL_CACHE_DIR, MODEL_CACHE_MAX_BYTES, load_or_fit
+
+OUTPUT_COLUMNS = ["series", "step", "order", "rmse", "arima", "sarimax", "error"]
+
+
+def read_table(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def write_table(df, path):
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def split_series(df, id_col, time_col, value_col):
+    # (series id, values in time order) for every series in the table
+    if df.empty:
+        return []
+    df = df.sort_values([id_col, time_col], kind="stable")
+    values = df[value_col].to_numpy(dtype="float64")
+    ids = df[id_col].to_numpy()
+    # Rows of one series are contiguous after the sort
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)]
+    return [(ids[start], values[start:end]) for start, end in zip(starts, ends)]
+
+
+def _init_worker():
+    warnings.filterwarnings("ignore")
+
+
+def forecast_series(
+    series_id, values, orders, horizon, refit_every, cache_dir, cache_max_bytes
+):
+    # Output rows for one series. Runs in a worker process
+    try:
+        order, rmse = best_order(select_order(values, orders, refit_every))
+        arima = load_or_fit(
+            values, order, "ARIMA", cache_dir, max_bytes=cache_max_bytes
+        ).forecast(horizon)
+        sarimax = load_or_fit(
+            values, order, "SARIMAX", cache_dir, max_bytes=cache_max_bytes
+        ).forecast(horizon)
+    except Exception as e:
+        # best_order raises ValueError when every order failed, e.g. on a
+        # series too short for walk-forward evaluation
+        return [(series_id, None, None, None, None, None, f"{type(e).__name__}: {e}")]
+    return [
+        (series_id, step, str(order), rmse, max(0, a), max(0, s), None)
+        for step, (a, s) in enumerate(zip(arima, sarimax), start=1)
+    ]
+
+
+def run(series, orders, horizon, refit_every, workers, cache_dir, cache_max_bytes):
+    # fork, unlike grid_search: this script is single-threaded, so forking
+    # it is safe, and workers inherit the already imported statsmodels
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(
+        workers, mp_context=context, initializer=_init_worker
+    ) as executor:
+        futures = [
+            executor.submit(
+                forecast_series,
+                series_id,
+                values,
+                orders,
+                horizon,
+                refit_every,
+                cache_dir,
+                cache_max_bytes,
+            )
+            for series_id, values in series
+        ]
+        rows = [row for future in futures for row in future.result()]
+    return pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--id-col", default="series")
+    parser.add_argument("--time-col", default="year")
+    parser.add_argument("--value-col", default="value")
+    parser.add_argument("--horizon", type=int, default=5)
+    parser.add_argument("--max-p", type=int, default=3)
+    parser.add_argument("--max-d", type=int, default=1)
+    parser.add_argument("--max-q", type=int, default=2)
+    parser.add_argument(
+        "--refit-every",
+        type=int,
+        default=10,
+        help="walk-forward steps between parameter refits (0: never)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-dir", default=MODEL_CACHE_DIR)
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=MODEL_CACHE_MAX_BYTES // 2**20,
+        help="size above which the least recently used models are evicted",
+    )
+    args = parser.parse_args()
+
+    orders = [
+        (p, d, q)
+        for p in range(args.max_p + 1)
+        for d in range(args.max_d + 1)
+        for q in range(args.max_q + 1)
+    ]
+    series = split_series(
+        read_table(args.input), args.id_col, args.time_col, args.value_col
+    )
+
+    start = time.perf_counter()
+    forecasts = run(
+        series,
+        orders,
+        args.horizon,
+        args.refit_every or None,
+        args.workers,
+        args.cache_dir,
+        args.cache_max_mb * 2**20,
+    )
+    elapsed = time.perf_counter() - start
+    write_table(forecasts, args.output)
+
+    failed = forecasts["error"].notna().sum()
+    print(
+        f"{len(series)} series ({failed} failed) in {elapsed:.1f} s: "
+        f"{len(series) / elapsed:.2f} series/s on {args.workers} workers"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Speed and parity of arima_selection.walk_forward_rmse's model updates.
+
+Scores ARIMA orders by one-step walk-forward RMSE three ways: a full refit
+on the growing history at every step (how it used to work), extend-only
+(one Kalman filter step per observation) and a refit every few steps. Runs
+on the TV seasons series from US_TV_seasons_by_year_Streamlit.py and on
+synthetic integrated ARMA(2,1) series:
+
+    python benchmark_walk_forward.py
+    python benchmark_walk_forward.py --lengths 300 1000 --skip-full-refit
+
+Exits non-zero if on a synthetic series the extend-only RMSE is further
+than --tolerance percent from the full refit's. The TV series is too short
+for its parameters to settle, so it is reported but not checked.
+"""
+
+import argparse
+import ast
+import os
+import time
+import warnings
+from math import sqrt
+
+import numpy as np
+from statsmodels.tsa.arima.model import ARIMA
+
+from arima_selection import TRAIN_FRACTION, walk_forward_rmse
+
+TV_APP = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "US_TV_seasons_by_year_Streamlit.py"
+)
+ORDERS = [(2, 0, 1), (1, 1, 1)]
+
+
+def tv_seasons(path=TV_APP):
+    # Season counts from the app's `data = ["year:count", ...]` list
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and ast.unparse(node.targets[0]) == "data":
+            return np.array(
+                [int(entry.split(":")[1]) for entry in ast.literal_eval(node.value)],
+                dtype=float,
+            )
+    raise ValueError(f"no data list in {path}")
+
+
+def integrated_arma(length, seed=0):
+    # ARMA(2,1) increments with Gaussian noise, cumulated above zero
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(size=length + 1)
+    steps = np.zeros(length)
+    for t in range(2, length):
+        steps[t] = (
+            0.5 * steps[t - 1]
+            - 0.3 * steps[t - 2]
+            + noise[t + 1]
+            + 0.4 * noise[t]
+        )
+    return 100 + np.cumsum(steps)
+
+
+def full_refit_rmse(X, order):
+    # walk_forward_rmse before incremental updates: a fresh fit per step
+    X = np.asarray(X, dtype=float)
+    train_size = int(len(X) * TRAIN_FRACTION)
+    test = X[train_size:]
+    sse = 0.0
+    for t in range(len(test)):
+        yhat = ARIMA(X[0 : train_size + t], order=order).fit().forecast()[0]
+        sse += (test[t] - max(0, yhat)) ** 2
+    return sqrt(sse / len(test))
+
+
+def timed(score, *args, **kwargs):
+    start = time.perf_counter()
+    rmse = score(*args, **kwargs)
+    return rmse, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[300])
+    parser.add_argument("--refit-every", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=2.0)
+    parser.add_argument(
+        "--skip-full-refit",
+        action="store_true",
+        help="only time the incremental updates (full refits are slow on long series)",
+    )
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    series = [(f"TV ({len(tv_seasons())} obs)", tv_seasons(), False)]
+    series += [
+        (f"synthetic {length}", integrated_arma(length), True) for length in args.lengths
+    ]
+
+    print(
+        f"{'series':<16} {'order':<10} {'full refit':>16} {'extend only':>16} "
+        f"{f'refit every {args.refit_every}':>16}"
+    )
+    failed = 0
+    for name, X, checked in series:
+        for order in ORDERS:
+            extend = timed(walk_forward_rmse, X, order)
+            periodic = timed(walk_forward_rmse, X, order, refit_every=args.refit_every)
+            if args.skip_full_refit:
+                full, full_cell = None, f"{'-':>16}"
+            else:
+                full = timed(full_refit_rmse, X, order)
+                full_cell = f"{full[0]:8.3f} {full[1]:6.2f}s"
+            print(
+                f"{name:<16} {str(order):<10} {full_cell} "
+                f"{extend[0]:8.3f} {extend[1]:6.2f}s {periodic[0]:8.3f} {periodic[1]:6.2f}s"
+            )
+            if checked and full is not None:
+                gap = 100 * abs(extend[0] - full[0]) / full[0]
+                if gap > args.tolerance:
+                    print(f"  extend-only RMSE is {gap:.1f}% from the full refit")
+                    failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
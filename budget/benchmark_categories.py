@@ -0,0 +1,134 @@
+"""Accuracy and speed of household_budget.py's product -> category guesses.
+
+Resolves a fixed test set of product names (exact, plural, misspelled, and
+names that only look like a known product) against product_categories.csv
+with product_index.ProductIndex, then times lookups against a synthetic
+catalog of the given size:
+
+    python budget/benchmark_categories.py
+    python budget/benchmark_categories.py --catalog-size 100000 --verbose
+
+A guess only preselects the Category selectbox, but a wrong one is easy to
+miss, so the script exits non-zero if any test name gets a wrong category.
+"""
+
+import argparse
+import csv
+import os
+import random
+import string
+import time
+
+from product_index import ProductIndex
+
+CATALOG = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "product_categories.csv"
+)
+
+# (product as typed, expected category or None for no guess)
+TEST_SET = [
+    # In the catalog
+    ("milk", "🛒 groceries"),
+    ("Electricity", "💡 utilities"),
+    ("car insurance", "🚗 transportation"),
+    ("rent", "🏠 home"),
+    # Plurals
+    ("Bananas", "🛒 groceries"),
+    ("tomatoes", "🛒 groceries"),
+    ("berries", "🛒 groceries"),
+    # Misspellings
+    ("choclate", "🛒 groceries"),
+    ("brocoli", "🛒 groceries"),
+    ("internt", "💡 utilities"),
+    ("electricty", "💡 utilities"),
+    ("car insurence", "🚗 transportation"),
+    # A known product plus or minus a word is a different thing
+    ("coffee table", None),
+    ("cheese grater", None),
+    ("phone case", None),
+    ("insurance", None),
+    ("shampoo", None),
+    # Unknown
+    ("zzz", None),
+    ("quantum flux capacitor", None),
+]
+
+
+def load_catalog(path=CATALOG):
+    with open(path, newline="", encoding="utf-8") as f:
+        return {
+            row["Category"]: [p for p in row["Products"].split(",") if p]
+            for row in csv.DictReader(f)
+        }
+
+
+def accuracy(index, verbose=False):
+    # (correct, wrong guesses, missed guesses)
+    correct = wrong = missed = 0
+    for product, expected in TEST_SET:
+        guess = index.category(product)
+        if guess == expected:
+            correct += 1
+        elif guess is None:
+            missed += 1
+        else:
+            wrong += 1
+        if verbose or guess != expected:
+            print(f"  {product!r}: {guess} (expected {expected})")
+    return correct, wrong, missed
+
+
+def synthetic_catalog(size, seed=0):
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+        for _ in range(max(size // 4, 10))
+    ]
+    products = {
+        " ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(size)
+    }
+    return {f"category {i % 15}": list(products)[i::15] for i in range(15)}
+
+
+def time_lookups(catalog, queries):
+    start = time.perf_counter()
+    index = ProductIndex(catalog)
+    index.closest("warm up")  # Builds the trigram index
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    for query in queries:
+        index.category(query)
+    return built, (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--catalog-size", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    correct, wrong, missed = accuracy(ProductIndex(load_catalog()), args.verbose)
+    print(
+        f"{correct}/{len(TEST_SET)} correct, {wrong} wrong guesses, "
+        f"{missed} missed guesses"
+    )
+
+    catalog = synthetic_catalog(args.catalog_size)
+    products = [p for products in catalog.values() for p in products]
+    rng = random.Random(1)
+    # Misspell one letter of known products, so lookups take the fuzzy path
+    queries = []
+    for product in rng.sample(products, min(args.queries, len(products))):
+        i = rng.randrange(len(product))
+        queries.append(product[:i] + rng.choice(string.ascii_lowercase) + product[i + 1 :])
+    built, per_lookup = time_lookups(catalog, queries)
+    print(
+        f"{len(products)} products: index built in {built:.2f} s, "
+        f"{per_lookup * 1000:.2f} ms per near-match lookup"
+    )
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,78 @@
+"""Size and fidelity of household_budget.py's downsampled spending chart.
+
+Builds synthetic daily spending histories of several lengths, reduces the
+cumulative line with charts.downsample_series, and reports the points and
+Plotly figure JSON sent to the browser before and after, the time taken,
+and how far the reduced line strays from the full one:
+
+    python budget/benchmark_charts.py
+    python budget/benchmark_charts.py --years 1 5 40 --max-deviation 0.5
+
+Exits non-zero if the reduced line deviates by more than --max-deviation
+percent of the final total.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from charts import CHART_MAX_POINTS, downsample_series
+
+
+def cumulative_spending(years, seed=0):
+    # A daily cumulative series like get_cumulative_spending's: small daily
+    # spend, a monthly rent step and the odd large purchase
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2000-01-01", periods=int(years * 365), freq="D")
+    daily = rng.gamma(2.0, 15.0, len(dates))
+    daily[dates.day == 1] += 1200
+    daily[rng.random(len(dates)) < 0.01] += rng.uniform(200, 2000)
+    return pd.DataFrame({"Date": dates, "Cumulative Sum": daily.cumsum()})
+
+
+def figure_bytes(df):
+    fig = px.line(df, x="Date", y="Cumulative Sum", title="Cumulative Spending Over Time")
+    return len(fig.to_json())
+
+
+def max_deviation(full, reduced):
+    # Largest gap between the full line and the reduced one drawn through
+    # its points, as a percentage of the final total
+    x = full["Date"].to_numpy(dtype="int64").astype(float)
+    xr = reduced["Date"].to_numpy(dtype="int64").astype(float)
+    line = np.interp(x, xr, reduced["Cumulative Sum"].to_numpy(dtype=float))
+    full_y = full["Cumulative Sum"].to_numpy(dtype=float)
+    return 100 * np.abs(line - full_y).max() / full_y[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=float, nargs="+", default=[2, 10, 40])
+    parser.add_argument("--max-points", type=int, default=CHART_MAX_POINTS)
+    parser.add_argument("--max-deviation", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(
+        f"{'years':>6} {'points':>13} {'figure KiB':>15} {'ms':>6} {'deviation':>10}"
+    )
+    worst = 0.0
+    for years in args.years:
+        full = cumulative_spending(years)
+        start = time.perf_counter()
+        reduced = downsample_series(full, "Date", "Cumulative Sum", args.max_points)
+        elapsed = time.perf_counter() - start
+        deviation = max_deviation(full, reduced)
+        worst = max(worst, deviation)
+        print(
+            f"{years:6g} {len(full):6d} -> {len(reduced):4d} "
+            f"{figure_bytes(full) / 1024:6.0f} -> {figure_bytes(reduced) / 1024:4.0f} "
+            f"{elapsed * 1000:6.1f} {deviation:9.2f}%"
+        )
+    return 1 if worst > args.max_deviation else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
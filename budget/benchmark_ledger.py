@@ -0,0 +1,105 @@
+"""Memory and speed of household_budget.py's in-session budget items.
+
+Compares ledger.ColumnarLedger with the list of dicts the session used to
+hold: memory, building a DataFrame for each use, and appending one item.
+Also checks that both give the same frame:
+
+    python budget/benchmark_ledger.py
+    python budget/benchmark_ledger.py --items 10000 50000 200000
+
+Exits non-zero if the frames differ.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from ledger import ColumnarLedger
+
+
+def random_items(count, seed=0):
+    # Ledger rows as load_ledger returns them
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "Product": rng.choice([f"product {i}" for i in range(200)], count),
+            "Amount": rng.integers(1, 5000, count) / 100,
+            "Category": rng.choice([f"category {i}" for i in range(15)], count),
+            "Date": pd.Timestamp("2020-01-01")
+            + pd.to_timedelta(rng.integers(0, 2000, count), unit="D"),
+        }
+    )
+
+
+def allocated(build):
+    # (result of build(), bytes it allocated and kept)
+    tracemalloc.start()
+    try:
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def best_time(call, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def same_frame(records, ledger):
+    expected = pd.DataFrame(records)
+    actual = ledger.to_frame().astype({"Product": object, "Category": object})
+    return expected.astype(actual.dtypes.to_dict()).equals(actual)
+
+
+def measure(count, repeats):
+    df = random_items(count)
+    records, dict_bytes = allocated(lambda: df.to_dict("records"))
+    ledger, ledger_bytes = allocated(lambda: ColumnarLedger.from_frame(df))
+    list_frame = best_time(lambda: pd.DataFrame(records), repeats)
+    ledger_frame = best_time(ledger.to_frame, repeats)
+    item = {"Product": "milk", "Amount": 2.5, "Category": "groceries", "Date": "2026-01-01"}
+    appends = 1000
+    start = time.perf_counter()
+    for _ in range(appends):
+        ledger.append(item)
+    append = (time.perf_counter() - start) / appends
+    ok = same_frame(records, ColumnarLedger.from_frame(df))
+    return dict_bytes, ledger_bytes, list_frame, ledger_frame, append, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'items':>8} {'dicts MB':>9} {'ledger MB':>10} "
+        f"{'DataFrame ms':>13} {'to_frame ms':>12} {'append us':>10}"
+    )
+    mismatches = 0
+    for count in args.items:
+        dict_bytes, ledger_bytes, list_frame, ledger_frame, append, ok = measure(
+            count, args.repeats
+        )
+        print(
+            f"{count:8d} {dict_bytes / 1e6:9.1f} {ledger_bytes / 1e6:10.1f} "
+            f"{list_frame * 1000:13.1f} {ledger_frame * 1000:12.2f} "
+            f"{append * 1e6:10.1f}"
+        )
+        if not ok:
+            print(f"  {count} items: to_frame differs from the list of dicts")
+            mismatches += 1
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+"""Password verifications per second, for sizing household_budget.py servers.
+
+Drives credentials.PasswordHasher with concurrent logins at 1..N workers and
+reports throughput and throughput per core:
+
+    python budget/benchmark_logins.py
+    python budget/benchmark_logins.py --workers 1 2 4 --seconds 5
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from credentials import PasswordHasher, hash_password
+
+
+def measure(workers, seconds):
+    hasher = PasswordHasher(max_workers=workers)
+    stored = hash_password("correct horse battery staple")
+    deadline = time.perf_counter() + seconds
+
+    def login_loop():
+        logins = 0
+        while time.perf_counter() < deadline:
+            hasher.verify("correct horse battery staple", stored)
+            logins += 1
+        return logins
+
+    start = time.perf_counter()
+    # One client per worker keeps the pool busy without tripping HasherBusy
+    with ThreadPoolExecutor(workers) as clients:
+        logins = sum(clients.map(lambda _: login_loop(), range(workers)))
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+    return logins / elapsed
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, cores}),
+        help="pool sizes to measure",
+    )
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'logins/s':>10} {'per core':>10}  ({cores} cores)")
+    for workers in args.workers:
+        rate = measure(workers, args.seconds)
+        print(f"{workers:8d} {rate:10.1f} {rate / min(workers, cores):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Correctness and scaling of household_budget.py's over-limit highlighting.
+
+Checks restrictions.compute_restriction_mask against the per-row
+re-filtering it replaced on random ledgers, then times it on ledgers of
+growing size, which should scale linearly:
+
+    python budget/benchmark_restrictions.py
+    python budget/benchmark_restrictions.py --rows 10000 100000 1000000
+
+Exits non-zero if the two ever disagree.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from restrictions import compute_restriction_mask
+
+PERIODS = ["Daily", "Weekly", "Monthly"]
+
+
+def random_ledger(rows, products=50, restricted=10, days=730, seed=0):
+    # (budget items, restrictions) like the app's, for random products
+    rng = np.random.default_rng(seed)
+    names = [f"product {i}" for i in range(products)]
+    df = pd.DataFrame(
+        {
+            "Product": rng.choice(names, rows),
+            "Amount": rng.integers(1, 50, rows).astype(float),
+            "Category": "🛒 groceries",
+            "Date": pd.Timestamp("2025-01-01")
+            + pd.to_timedelta(rng.integers(0, days, rows), unit="D"),
+        }
+    )
+    restrictions = {
+        name: {"limit": float(rng.integers(20, 400)), "period": rng.choice(PERIODS)}
+        for name in rng.choice(names, restricted, replace=False)
+    }
+    return df, restrictions
+
+
+def per_row_mask(df, restrictions):
+    # The per-row re-filtering the table styler used to do
+    flagged = []
+    for _, row in df.iterrows():
+        restriction = restrictions.get(row["Product"])
+        if restriction is None:
+            flagged.append(False)
+            continue
+        same = df["Product"] == row["Product"]
+        if restriction["period"] == "Daily":
+            start = row["Date"]
+        elif restriction["period"] == "Weekly":
+            start = row["Date"] - pd.Timedelta(days=row["Date"].dayofweek)
+        else:
+            start = row["Date"].replace(day=1)
+        in_period = (df["Date"] >= start) & (df["Date"] <= row["Date"])
+        flagged.append(df.loc[same & in_period, "Amount"].sum() > restriction["limit"])
+    return pd.Series(flagged, index=df.index)
+
+
+def check(rows, seeds):
+    # Number of seeds on which the two masks disagree
+    mismatches = 0
+    for seed in range(seeds):
+        # Few products and days, so limits are crossed often
+        df, restrictions = random_ledger(rows, products=8, restricted=5, days=60, seed=seed)
+        if not compute_restriction_mask(df, restrictions).equals(per_row_mask(df, restrictions)):
+            print(f"  seed {seed}: masks differ")
+            mismatches += 1
+    return mismatches
+
+
+def time_mask(rows, repeats):
+    df, restrictions = random_ledger(rows)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        mask = compute_restriction_mask(df, restrictions)
+        best = min(best, time.perf_counter() - start)
+    return best, int(mask.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--check-rows", type=int, default=500)
+    parser.add_argument("--seeds", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    mismatches = check(args.check_rows, args.seeds)
+    print(
+        f"{args.seeds - mismatches}/{args.seeds} random ledgers of "
+        f"{args.check_rows} rows match the per-row check"
+    )
+
+    print(f"{'rows':>10} {'seconds':>8} {'us/row':>7} {'flagged':>8}")
+    for rows in args.rows:
+        seconds, flagged = time_mask(rows, args.repeats)
+        print(f"{rows:10d} {seconds:8.3f} {seconds / rows * 1e6:7.2f} {flagged:8d}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,231 @@
+# Month-end spend forecasting for household_budget.py. Models are fitted in
+# worker processes, so everything a worker runs lives in this importable
+# module rather than in the Streamlit script.
+
+import hashlib
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from worker_processes import app_script_not_rerun, forkserver_context
+
+FORECAST_ORDER = (1, 0, 0)
+MIN_ARIMA_MONTHS = 6  # Shorter histories are forecast by their mean
+ANOMALY_Z = 3.5  # Robust z-score beyond which a month counts as unusual
+SIGMA_FLOOR = 0.1  # Smallest residual spread, as a fraction of the mean rate
+MIN_ACTIVE_MONTHS = 3  # Months with spend needed before flagging anything
+# Ledger categories that are not spending, e.g. money put into savings
+NON_SPENDING_CATEGORIES = {"Savings"}
+FORECAST_CACHE_SIZE = 4096  # Fitted category models kept per process
+
+
+
+def monthly_history(df, current_month):
+    # {category: monthly totals from the category's first month up to the
+    # last complete month}, with months without spend filled with zero
+    months = df["Date"].dt.to_period("M")
+    past = (months < current_month) & ~df["Category"].isin(NON_SPENDING_CATEGORIES)
+    totals = (
+        df.loc[past, "Amount"]
+        .groupby([df.loc[past, "Category"], months[past]], observed=True)
+        .sum()
+    )
+    history = {}
+    for category, series in totals.groupby(level=0, observed=True):
+        series = series.droplevel(0)
+        months_seen = pd.period_range(series.index.min(), current_month - 1, freq="M")
+        history[category] = series.reindex(months_seen, fill_value=0.0)
+    return history
+
+
+def series_key(values):
+    # Changes only when the monthly totals do, i.e. when a month completes
+    # or a back-dated item lands in a past month
+    values = np.round(np.asarray(values, dtype="float64"), 2)
+    return hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
+
+
+def robust_sigma(residuals):
+    # Scaled median absolute deviation; a single spike cannot inflate it
+    deviation = np.abs(residuals - np.median(residuals))
+    return float(1.4826 * np.median(deviation))
+
+
+def daily_rates(monthly_totals):
+    # Spend per day of each month, so February is not short on spending
+    return monthly_totals.to_numpy(dtype="float64") / monthly_totals.index.days_in_month
+
+
+def category_model(values, fitted, forecast, method):
+    # Model summary from in-sample fitted values and next month's forecast
+    residuals = values - fitted
+    sigma = robust_sigma(residuals)
+    if sigma == 0:
+        # Lumpy histories (spend every few months) and constant ones have
+        # no MAD; fall back to the plain spread
+        sigma = float(np.std(residuals))
+    sigma = max(sigma, SIGMA_FLOOR * float(values.mean()))
+    active_months = int(np.count_nonzero(values))
+    anomalies = (
+        np.flatnonzero(np.abs(residuals) > ANOMALY_Z * sigma).tolist()
+        if sigma > 0 and active_months >= MIN_ACTIVE_MONTHS
+        else []
+    )
+    return {
+        "method": method,
+        "daily_rate": max(float(forecast), 0.0),
+        "sigma": sigma,
+        "active_months": active_months,
+        "anomalies": anomalies,
+    }
+
+
+def mean_model(values):
+    # The history's mean as both fit and forecast
+    values = np.asarray(values, dtype="float64")
+    mean = values.mean()
+    return category_model(values, np.full(len(values), mean), mean, "mean")
+
+
+def fit_category_model(values, order=FORECAST_ORDER):
+    # Next month's expected daily spend rate plus the residual spread and the
+    # positions of unusual months. Runs in a worker process
+    values = np.asarray(values, dtype="float64")
+    if len(values) < MIN_ARIMA_MONTHS:
+        return mean_model(values)
+    from statsmodels.tsa.arima.model import ARIMA
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            result = ARIMA(values, order=order, trend="c").fit()
+    except (ValueError, np.linalg.LinAlgError):
+        return mean_model(values)
+    return category_model(
+        values,
+        np.asarray(result.fittedvalues),
+        result.forecast(1)[0],
+        f"ARIMA{order}",
+    )
+
+
+class ForecastEngine:
+    # One model per category, fitted in a process pool and kept until that
+    # category's monthly history changes. A category whose fit fails in the
+    # pool, or whose worker dies, gets the mean model for this call only
+    def __init__(self, max_workers=None, cache_size=FORECAST_CACHE_SIZE):
+        self.max_workers = max_workers
+        self._executor = self._new_executor()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_size = cache_size
+
+    def _new_executor(self):
+        context = forkserver_context(["budget_forecast", "statsmodels.tsa.arima.model"])
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def _submit(self, values):
+        with self._lock:
+            executor = self._executor
+        try:
+            with app_script_not_rerun():
+                return executor.submit(fit_category_model, values)
+        except BrokenProcessPool:
+            self._replace_executor(executor)
+            with self._lock:
+                executor = self._executor
+            with app_script_not_rerun():
+                return executor.submit(fit_category_model, values)
+
+    def _replace_executor(self, broken):
+        # A worker died (killed, out of memory); later calls get a fresh pool
+        with self._lock:
+            if self._executor is broken:
+                self._executor = self._new_executor()
+        broken.shutdown(wait=False)
+
+    def models(self, history):
+        # history maps category -> monthly totals with a monthly PeriodIndex
+        rates = {category: daily_rates(totals) for category, totals in history.items()}
+        keys = {
+            category: (category, series_key(values))
+            for category, values in rates.items()
+        }
+        models = {}
+        with self._lock:
+            for category, key in keys.items():
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    models[category] = self._cache[key]
+        with self._lock:
+            executor = self._executor
+        futures = {
+            category: self._submit(rates[category])
+            for category in rates
+            if category not in models
+        }
+        broken = False
+        for category, future in futures.items():
+            try:
+                models[category] = future.result()
+            except BrokenProcessPool:
+                broken = True
+                models[category] = mean_model(rates[category])
+                continue
+            except Exception:
+                # Not cached, so the fit is retried on the next call
+                models[category] = mean_model(rates[category])
+                continue
+            with self._lock:
+                self._cache[keys[category]] = models[category]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if broken:
+            self._replace_executor(executor)
+        return models
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+def unusual_months(history, models):
+    # (category, month, amount) for every flagged month, oldest first
+    flagged = [
+        (category, months.index[position], months.iloc[position])
+        for category, model in models.items()
+        for months in [history[category]]
+        for position in model["anomalies"]
+    ]
+    return sorted(flagged, key=lambda row: row[1])
+
+
+def project_month_end(models, month_to_date, today):
+    # Spend so far plus each category's forecast rate over the days left.
+    # A category is unusual once it is already past what an unusual whole
+    # month would cost, and only if it has enough months of spend to say
+    days = pd.Period(today, freq="M").days_in_month
+    rows = []
+    for category in dict.fromkeys([*models, *month_to_date]):
+        if category in NON_SPENDING_CATEGORIES:
+            continue
+        model = models.get(category, {"daily_rate": 0.0, "sigma": 0.0})
+        spent = month_to_date.get(category, 0.0)
+        band = (model["daily_rate"] + ANOMALY_Z * model["sigma"]) * days
+        flaggable = model.get("active_months", 0) >= MIN_ACTIVE_MONTHS
+        rows.append(
+            (
+                category,
+                spent,
+                model["daily_rate"] * days,
+                spent + model["daily_rate"] * (days - today.day),
+                flaggable and spent > band,
+            )
+        )
+    return pd.DataFrame(
+        rows, columns=["Category", "Spent", "Forecast", "Projected", "Unusual"]
+    )
@@ -0,0 +1,49 @@
+# Chart data reduction for household_budget.py, kept out of the Streamlit
+# script so benchmark_charts.py can import it.
+
+import numpy as np
+
+CHART_MAX_POINTS = 500  # Points per line sent to the browser
+WEEKLY_BUCKET_FACTOR = 4  # Bucket by week when days exceed this many budgets
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from
+    # each bucket in between, the point forming the largest triangle with the
+    # previously kept point and the next bucket's average
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end : edges[i + 2]].mean()
+            next_y = y[end : edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs(
+            (x[a] - next_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_series(df, x, y, max_points=CHART_MAX_POINTS):
+    # Weekly bucketing first for long daily histories (the last value of a
+    # cumulative series per week loses nothing visible), then LTTB
+    if len(df) > max_points * WEEKLY_BUCKET_FACTOR:
+        df = df.groupby(df[x].dt.to_period("W"), sort=False).last()
+    if len(df) <= max_points:
+        return df
+    indices = lttb_indices(
+        df[x].to_numpy(dtype="int64").astype(float),
+        df[y].to_numpy(dtype=float),
+        max_points,
+    )
+    return df.iloc[indices]
@@ -0,0 +1,151 @@
+# Password storage for household_budget.py: salted scrypt hashes checked on a
+# bounded worker pool, per-user throttling of failed logins, and an upgrade
+# path for the unsalted SHA-256 hashes older accounts were created with.
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = 2**14  # 16 MiB of memory per hash with r=8
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_MAXMEM = 64 * 1024 * 1024
+SALT_BYTES = 16
+KEY_BYTES = 32
+HASH_SCHEME = "scrypt"
+THROTTLE_MAX_TRACKED = 10000  # Usernames tracked before stale ones are purged
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"too many failed logins, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def b64encode(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=SCRYPT_MAXMEM,
+        dklen=KEY_BYTES,
+    )
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    # "scrypt$n$r$p$salt$key", with salt and key base64-encoded
+    salt = os.urandom(SALT_BYTES)
+    key = scrypt(password, salt, n, r, p)
+    return f"{HASH_SCHEME}${n}${r}${p}${b64encode(salt)}${b64encode(key)}"
+
+
+def is_legacy_hash(stored):
+    # Accounts created before scrypt store a bare SHA-256 hex digest
+    return not stored.startswith(f"{HASH_SCHEME}$")
+
+
+def check_password(password, stored):
+    if is_legacy_hash(stored):
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, stored)
+    _, n, r, p, salt, key = stored.split("$")
+    candidate = scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(candidate, base64.b64decode(key))
+
+
+def needs_rehash(stored):
+    # Legacy hashes and hashes made with older cost parameters
+    if is_legacy_hash(stored):
+        return True
+    _, n, r, p, _, _ = stored.split("$")
+    return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+class PasswordHasher:
+    # Runs the KDF on a bounded thread pool (hashlib.scrypt releases the GIL),
+    # and refuses work rather than queueing without limit when saturated
+    def __init__(self, max_workers=None, max_pending=None, wait=5.0):
+        max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="kdf")
+        self._slots = threading.BoundedSemaphore(max_pending or 4 * max_workers)
+        self.wait = wait
+        # Unknown usernames are checked against this, so response time does
+        # not reveal which accounts exist
+        self._dummy_hash = hash_password("")
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            raise HasherBusy("password hashing pool is saturated")
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(hash_password, password)
+
+    def verify(self, password, stored):
+        if stored is None:
+            self._run(check_password, password, self._dummy_hash)
+            return False
+        return self._run(check_password, password, stored)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LoginThrottle:
+    # At most max_failures failed logins per username within a sliding window
+    # of `window` seconds; further attempts are refused before any hashing
+    def __init__(self, max_failures, window):
+        self.max_failures = max_failures
+        self.window = window
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def check(self, username):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._failures.get(username)
+            if not failures:
+                return
+            while failures and failures[0] <= now - self.window:
+                failures.popleft()
+            if not failures:
+                del self._failures[username]
+            elif len(failures) >= self.max_failures:
+                raise LoginThrottled(failures[0] + self.window - now)
+
+    def record_failure(self, username):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._failures) >= THROTTLE_MAX_TRACKED:
+                # Failures spread over many usernames must not grow this forever
+                self._failures = {
+                    name: failures
+                    for name, failures in self._failures.items()
+                    if failures[-1] > now - self.window
+                }
+            failures = self._failures.setdefault(
+                username, deque(maxlen=self.max_failures)
+            )
+            failures.append(now)
+
+    def reset(self, username):
+        with self._lock:
+            self._failures.pop(username, None)
@@ -0,0 +1,64 @@
+# SQLite connection pooling and session caching for household_budget.py,
+# kept out of the Streamlit script so they can be imported on their own.
+
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class ConnectionPool:
+    def __init__(self, db_file, size):
+        self._connections = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(
+                db_file, check_same_thread=False, cached_statements=256
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+
+class SessionCache:
+    # session_id -> (username, user_id, currency), kept for at most ttl
+    # seconds and never past the session's own expiry
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        user, valid_until = entry
+        if time.monotonic() >= valid_until:
+            self.invalidate(session_id)
+            return None
+        return user
+
+    def put(self, session_id, user, expiry):
+        seconds_left = (expiry - datetime.now()).total_seconds()
+        valid_until = time.monotonic() + min(self._ttl, seconds_left)
+        with self._lock:
+            self._entries[session_id] = (user, valid_until)
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def invalidate_user(self, username):
+        with self._lock:
+            for session_id, (user, _) in list(self._entries.items()):
+                if user[0] == username:
+                    del self._entries[session_id]
@@ -1,19 +1,28 @@
-import sys
-import importlib
-import streamlit
-
-importlib.reload(streamlit)
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 import os
+import atexit
+import csv
 from datetime import datetime, timedelta
 import io
-import base64
+import gzip
+import tempfile
 import sqlite3
-import hashlib
+import bisect
+import re
 import uuid
+import threading
+import time
+import logging
 from http.cookies import SimpleCookie
+from credentials import (
+    HasherBusy,
+    LoginThrottle,
+    LoginThrottled,
+    PasswordHasher,
+    needs_rehash,
+)
+from database import ConnectionPool, SessionCache
+from write_behind import WriteBehindError, WriteBehindQueue, atomic_write, file_lock
 
 
 # Set page title
@@ -42,10 +51,11 @@ def display_sidebar():
                 clear_auth_cookie()
                 st.session_state.logged_in = False
                 st.session_state.username = None
+                st.session_state.user_id = None
                 st.session_state.show_login_form = False
                 st.session_state.show_signup_form = False
                 st.success("You have been logged out successfully.")
-                st.experimental_rerun()
+                rerun()
     else:
         with col1:
             if st.button("🔑 Login", key="login_button"):
@@ -67,11 +77,118 @@ def display_sidebar():
 
 DB_FILE = "users.db"
 SETTINGS_CSV = "app_settings.csv"
+LEDGER_COLUMNS = ["Product", "Amount", "Category", "Date"]
+DATA_DIR = "user_data"  # One sub-directory of CSVs per users.id
+DEFAULT_CATEGORIES_CSV = "product_categories.csv"
+# Data from before per-user partitions: one household shared by all users,
+# with its ledger rows under user id 0. migrate_legacy_data hands it over
+LEGACY_USER_ID = 0
+LEGACY_BUDGET_CSV = "budget_data.csv"
+LEGACY_DATA_FILES = [
+    "product_categories.csv",
+    "monthly_budget.csv",
+    "recurring_expenses.csv",
+    "savings_goal.csv",
+    "spending_restrictions.csv",
+]
+LEGACY_MIGRATION_SOURCE = "legacy-shared-data"  # ledger_imports marker
+# Session state that belongs to the logged-in user's partition
+USER_STATE_KEYS = [
+    "budget_items",
+    "budget_aggregates",
+    "product_categories",
+    "product_index",
+    "monthly_budget",
+    "recurring_expenses",
+    "savings_goal",
+    "spending_restrictions",
+    "recurring_checked_on",
+    "forecast_history",
+]
 CURRENCIES_BEFORE = {"$", "€", "£", "¥", "₹", "A$", "C$", "S$", "CHF"}
+DB_POOL_SIZE = 4
+SESSION_CACHE_TTL = 60  # Seconds a cached session lookup stays valid
+SESSION_SWEEP_INTERVAL = 3600  # Seconds between expired-session sweeps
+SESSION_SWEEP_BATCH = 500
+SESSION_SWEEP_RETRY = 60  # Seconds before retrying a failed sweep
+# Per parse_* loader: one current entry per active user's file, plus the
+# versions a save has just superseded until they are evicted
+PARSE_CACHE_MAX_ENTRIES = 512
+PARSE_CACHE_TTL = 3600  # Seconds, so idle users' entries do not linger
+KDF_WORKERS = os.cpu_count() or 1  # Concurrent password hashes
+LOGIN_MAX_FAILURES = 5  # Failed logins per username within LOGIN_WINDOW
+LOGIN_WINDOW = 300  # Seconds
+
+# Statements are kept as constants so each pooled connection's statement
+# cache can reuse the prepared versions across reruns
+SELECT_SESSION_SQL = """SELECT s.username, s.expiry, u.id, u.currency
+                        FROM sessions s JOIN users u ON u.username = s.username
+                        WHERE s.session_id = ? AND s.expiry > ?"""
+INSERT_SESSION_SQL = (
+    "INSERT INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)"
+)
+DELETE_SESSION_SQL = "DELETE FROM sessions WHERE session_id = ?"
+# Batched so a large backlog never holds the write lock for long
+DELETE_EXPIRED_SESSIONS_SQL = """DELETE FROM sessions WHERE rowid IN
+                                 (SELECT rowid FROM sessions
+                                  WHERE expiry <= ? LIMIT ?)"""
+SELECT_USER_SQL = "SELECT id, password, currency FROM users WHERE username = ?"
+UPDATE_PASSWORD_SQL = "UPDATE users SET password = ? WHERE id = ?"
+SELECT_USER_ACCOUNT_SQL = "SELECT id, currency FROM users WHERE username = ?"
+INSERT_USER_SQL = "INSERT INTO users (username, email, password) VALUES (?, ?, ?)"
+UPDATE_CURRENCY_SQL = "UPDATE users SET currency = ? WHERE username = ?"
+
+
+@st.cache_resource
+def get_db_pool():
+    pool = ConnectionPool(DB_FILE, DB_POOL_SIZE)
+    with pool.connection() as conn:
+        init_db(conn)
+    return pool
+
+
+@st.cache_resource
+def get_session_cache():
+    return SessionCache(SESSION_CACHE_TTL)
+
+
+def sweep_expired_sessions(pool, batch_size=SESSION_SWEEP_BATCH):
+    now = datetime.now().isoformat(" ")
+    deleted = 0
+    while True:
+        with pool.connection() as conn:
+            with conn:
+                c = conn.execute(DELETE_EXPIRED_SESSIONS_SQL, (now, batch_size))
+        deleted += c.rowcount
+        if c.rowcount < batch_size:
+            return deleted
+
+
+@st.cache_resource
+def start_session_sweeper(_pool):
+    # One daemon thread per server process
+    def sweep_forever():
+        while True:
+            try:
+                sweep_expired_sessions(_pool)
+            except Exception:
+                # e.g. "database is locked" during a long import; the thread
+                # must outlive it, or expired sessions pile up until restart
+                logging.getLogger("household_budget").exception(
+                    "Expired-session sweep failed"
+                )
+                time.sleep(SESSION_SWEEP_RETRY)
+                continue
+            time.sleep(SESSION_SWEEP_INTERVAL)
+
+    thread = threading.Thread(
+        target=sweep_forever, name="session-sweeper", daemon=True
+    )
+    thread.start()
+    return thread
 
 
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
+def init_db(conn):
     c = conn.cursor()
     c.execute(
         """CREATE TABLE IF NOT EXISTS users
@@ -87,47 +204,105 @@ def init_db():
                   username TEXT NOT NULL,
                   expiry DATETIME NOT NULL)"""
     )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions (expiry)")
     conn.commit()
-    conn.close()
+    init_ledger(conn)
 
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def init_ledger(conn):
+    c = conn.cursor()
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS ledger
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL,
+                  product TEXT NOT NULL,
+                  amount REAL NOT NULL,
+                  category TEXT NOT NULL,
+                  date DATE NOT NULL,
+                  row_hash INTEGER)"""
+    )
+    # Ledgers created before statement imports lack the row_hash column
+    columns = [row[1] for row in c.execute("PRAGMA table_info(ledger)")]
+    if "row_hash" not in columns:
+        c.execute("ALTER TABLE ledger ADD COLUMN row_hash INTEGER")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ledger_user_date ON ledger (user_id, date)"
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_ledger_user_product
+                 ON ledger (user_id, product, date)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_ledger_user_category
+                 ON ledger (user_id, category, date)"""
+    )
+    # Only imported statement rows carry a hash; it makes re-imports idempotent
+    c.execute(
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_ledger_user_hash
+                 ON ledger (user_id, row_hash) WHERE row_hash IS NOT NULL"""
+    )
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS ledger_imports
+                 (user_id INTEGER NOT NULL,
+                  source TEXT NOT NULL,
+                  imported_at DATETIME NOT NULL,
+                  PRIMARY KEY (user_id, source))"""
+    )
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS recurring_watermarks
+                 (user_id INTEGER NOT NULL,
+                  expense_key TEXT NOT NULL,
+                  anchor DATE NOT NULL,
+                  last_posted DATE NOT NULL,
+                  PRIMARY KEY (user_id, expense_key))"""
+    )
+    conn.commit()
+
+
+@st.cache_resource
+def get_password_hasher():
+    hasher = PasswordHasher(max_workers=KDF_WORKERS)
+    atexit.register(hasher.shutdown)
+    return hasher
+
+
+@st.cache_resource
+def get_login_throttle():
+    return LoginThrottle(LOGIN_MAX_FAILURES, LOGIN_WINDOW)
 
 
 def create_session(username):
     session_id = str(uuid.uuid4())
     expiry = datetime.now() + timedelta(days=1)  # Session expires in 1 day
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO sessions (session_id, username, expiry) VALUES (?, ?, ?)",
-        (session_id, username, expiry),
-    )
-    conn.commit()
-    conn.close()
+    with get_db_pool().connection() as conn:
+        with conn:
+            conn.execute(INSERT_SESSION_SQL, (session_id, username, expiry))
     return session_id
 
 
 def get_session(session_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(
-        "SELECT username, expiry FROM sessions WHERE session_id = ?", (session_id,)
-    )
-    result = c.fetchone()
-    conn.close()
-    if result and datetime.now() < datetime.fromisoformat(result[1]):
-        return result[0]
+    # Returns (username, user_id, currency) for a live session
+    session_cache = get_session_cache()
+    user = session_cache.get(session_id)
+    if user:
+        return user
+    with get_db_pool().connection() as conn:
+        c = conn.cursor()
+        # Expired sessions are filtered out by the query itself
+        c.execute(SELECT_SESSION_SQL, (session_id, datetime.now().isoformat(" ")))
+        result = c.fetchone()
+    if result:
+        user = (result[0], result[2], result[3])
+        session_cache.put(session_id, user, datetime.fromisoformat(result[1]))
+        return user
     return None
 
 
 def delete_session(session_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-    conn.commit()
-    conn.close()
+    with get_db_pool().connection() as conn:
+        with conn:
+            conn.execute(DELETE_SESSION_SQL, (session_id,))
+    get_session_cache().invalidate(session_id)
 
 
 def set_auth_cookie(session_id):
@@ -158,21 +333,18 @@ def clear_auth_cookie():
 def check_session():
     auth_cookie = get_auth_cookie()
     if auth_cookie:
-        username = get_session(auth_cookie.value)
-        if username:
+        user = get_session(auth_cookie.value)
+        if user:
+            username, user_id, user_currency = user
             st.session_state.logged_in = True
             st.session_state.username = username
-            # Fetch user currency
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute("SELECT currency FROM users WHERE username = ?", (username,))
-            user_currency = c.fetchone()[0]
-            conn.close()
+            st.session_state.user_id = user_id
             st.session_state.currency = user_currency
         else:
             # Session expired or invalid, clear session state
             st.session_state.logged_in = False
             st.session_state.username = None
+            st.session_state.user_id = None
             st.session_state.currency = "$"
             clear_auth_cookie()
     else:
@@ -180,27 +352,38 @@ def check_session():
         if not st.session_state.get("logged_in", False):
             st.session_state.logged_in = False
             st.session_state.username = None
+            st.session_state.user_id = None
             st.session_state.currency = "$"
 
 
 def verify_user(username, password):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    hashed_password = hash_password(password)
-    c.execute(
-        "SELECT * FROM users WHERE username=? AND password=?",
-        (username, hashed_password),
-    )
-    user = c.fetchone()
-    conn.close()
-    if user:
-        session_id = create_session(username)
-        set_auth_cookie(session_id)
-        st.session_state.logged_in = True
-        st.session_state.username = username
-        st.session_state.currency = user[4]
-        return True
-    return False
+    # Raises LoginThrottled after too many failures and HasherBusy when the
+    # hashing pool is saturated
+    throttle = get_login_throttle()
+    throttle.check(username)
+    with get_db_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute(SELECT_USER_SQL, (username,))
+        user = c.fetchone()
+    hasher = get_password_hasher()
+    if not hasher.verify(password, user[1] if user else None):
+        throttle.record_failure(username)
+        return False
+    throttle.reset(username)
+    user_id, stored_hash, currency = user
+    if needs_rehash(stored_hash):
+        # Upgrade legacy SHA-256 (or outdated scrypt) hashes while we have
+        # the plain password
+        with get_db_pool().connection() as conn:
+            with conn:
+                conn.execute(UPDATE_PASSWORD_SQL, (hasher.hash(password), user_id))
+    session_id = create_session(username)
+    set_auth_cookie(session_id)
+    st.session_state.logged_in = True
+    st.session_state.username = username
+    st.session_state.user_id = user_id
+    st.session_state.currency = currency
+    return True
 
 
 def show_signup_form():
@@ -218,23 +401,26 @@ def show_signup_form():
             elif password != confirm_password:
                 st.error("Passwords do not match.")
             else:
-                if add_user(username, email, password):
+                try:
+                    created = add_user(username, email, password)
+                except HasherBusy:
+                    st.error("The server is busy. Please try again in a moment.")
+                    return
+                if created:
                     st.success(f"Account created for {username}!")
                     session_id = create_session(username)
                     set_auth_cookie(session_id)
                     st.session_state.logged_in = True
                     st.session_state.username = username
                     st.session_state.show_signup_form = False
-                    # Fetch the user's currency from the database
-                    conn = sqlite3.connect(DB_FILE)
-                    c = conn.cursor()
-                    c.execute(
-                        "SELECT currency FROM users WHERE username = ?", (username,)
-                    )
-                    user_currency = c.fetchone()[0]
-                    conn.close()
+                    # Fetch the user's id and currency from the database
+                    with get_db_pool().connection() as conn:
+                        c = conn.cursor()
+                        c.execute(SELECT_USER_ACCOUNT_SQL, (username,))
+                        user_id, user_currency = c.fetchone()
+                    st.session_state.user_id = user_id
                     st.session_state.currency = user_currency
-                    st.experimental_rerun()
+                    rerun()
                 else:
                     st.error("Username or email already exists.")
 
@@ -250,42 +436,103 @@ def show_login_form():
             if not username or not password:
                 st.error("Please enter both username and password.")
             else:
-                if verify_user(username, password):
+                try:
+                    verified = verify_user(username, password)
+                except LoginThrottled as e:
+                    st.error(
+                        f"Too many failed attempts. Try again in {e.retry_after:.0f} seconds."
+                    )
+                    return
+                except HasherBusy:
+                    st.error("The server is busy. Please try again in a moment.")
+                    return
+                if verified:
                     st.session_state.logged_in = True
                     st.session_state.username = username
                     st.session_state.show_login_form = False
                     st.success(f"Logged in as {username}!")
-                    st.experimental_rerun()
+                    rerun()
                 else:
                     st.error("Invalid username or password.")
 
 
 def add_user(username, email, password):
-    hashed_password = hash_password(password)
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    hashed_password = get_password_hasher().hash(password)
+    with get_db_pool().connection() as conn:
+        try:
+            with conn:
+                conn.execute(INSERT_USER_SQL, (username, email, hashed_password))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+
+def file_signature(path):
+    # Changes whenever the file is rewritten (atomic_write swaps the inode);
+    # None if it does not exist
     try:
-        c.execute(
-            "INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
-            (username, email, hashed_password),
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+# Each server process journals to "write_behind.journal.<pid>-<tag>"
+WRITE_BEHIND_JOURNAL = "write_behind.journal"
+
+
+@st.cache_resource
+def get_write_queue():
+    write_queue = WriteBehindQueue(get_db_pool(), WRITE_BEHIND_JOURNAL)
+    atexit.register(write_queue.close)  # Flush on shutdown
+    return write_queue
+
+
+def flush_writes():
+    # Wait for queued writes to reach the database and CSV files; False (with
+    # the error shown) if they failed or did not finish in time
+    try:
+        get_write_queue().flush()
+    except WriteBehindError as e:
+        st.error(f"{e}. Recent changes are kept and will be retried.")
         return False
-    finally:
-        conn.close()
+    return True
+
+
+def save_csv(df, path, **to_csv_kwargs):
+    # Queue a write; repeated saves of one file during a run collapse into
+    # the last one, handed to the write-behind queue by flush_csv_writes
+    if "pending_csv_writes" not in st.session_state:
+        st.session_state.pending_csv_writes = {}
+    st.session_state.pending_csv_writes[path] = (df, to_csv_kwargs)
+
+
+def flush_csv_writes():
+    pending = st.session_state.get("pending_csv_writes", {})
+    while pending:
+        path, (df, to_csv_kwargs) = pending.popitem()
+        get_write_queue().submit("csv", path=path, data=df.to_csv(**to_csv_kwargs))
+
+
+def rerun():
+    # st.rerun stops the script, so queue pending writes first
+    flush_csv_writes()
+    st.rerun()
 
 
 def load_settings():
+    # Read with the csv module: this runs above the login gate, before
+    # pandas is imported
     if os.path.exists(SETTINGS_CSV):
-        settings = pd.read_csv(SETTINGS_CSV, index_col=0).to_dict()["value"]
-        return settings
+        with open(SETTINGS_CSV, newline="", encoding="utf-8") as f:
+            rows = csv.reader(f)
+            next(rows, None)  # ",value" header written by save_settings
+            return {row[0]: row[1] for row in rows if len(row) >= 2}
     return {"currency": "$"}  # Default settings
 
 
 def save_settings(settings):
-    pd.DataFrame({"value": settings}, index=settings.keys()).to_csv(SETTINGS_CSV)
+    save_csv(pd.DataFrame({"value": settings}, index=settings.keys()), SETTINGS_CSV)
 
 
 # Initialize settings in session state
@@ -314,12 +561,20 @@ def add_new_item():
             "Date", value=datetime.now().date(), key="new_item_date_input"
         )
 
-        # Category selection for custom products
-        category = get_category(product)
+        # Category selection for products not in the catalog. A plural or
+        # near match only preselects the category, so a wrong guess
+        # ("coffee table" -> groceries) can be corrected before it is saved
+        category = st.session_state.product_index.category(product, exact=True)
         if product and not category:
+            suggestions = st.session_state.product_index.with_prefix(product)
+            if suggestions:
+                st.caption(f"Known products: {', '.join(suggestions)}")
+            options = list(st.session_state.product_categories.keys()) + ["Other"]
+            guess = get_category(product)
             category = st.selectbox(
                 "Category",
-                options=list(st.session_state.product_categories.keys()) + ["Other"],
+                options=options,
+                index=options.index(guess) if guess in options else 0,
             )
 
         add_item = st.button("Add Item", key="add_item_button")
@@ -333,18 +588,16 @@ def add_new_item():
                 "Category": category,
                 "Date": date,
             }
-            st.session_state.budget_items.append(new_item)
-            df = pd.DataFrame(st.session_state.budget_items)
-            save_budget_data(df)
-            st.experimental_rerun()
-
-        # Add new product to category if it's not already there
-        if category != "Other":
-            if category not in st.session_state.product_categories:
-                st.session_state.product_categories[category] = []
-            if product.lower() not in st.session_state.product_categories[category]:
-                st.session_state.product_categories[category].append(product.lower())
+            append_budget_items([new_item])
+
+            # Add new product to category if it's not already there; its
+            # category was either exact or picked in the selectbox above
+            if category != "Other" and product not in st.session_state.product_index:
+                st.session_state.product_categories.setdefault(category, []).append(
+                    normalize_product(product)
+                )
                 save_product_categories(st.session_state.product_categories)
+            rerun()
 
         st.success(f"Item added successfully! Category: {category}")
         # Reset the product input
@@ -355,9 +608,9 @@ def add_new_item():
         display_budget_items()
 
 
-def load_budget_data():
-    if os.path.exists(BUDGET_CSV):
-        df = pd.read_csv(BUDGET_CSV)
+def load_budget_data(path):
+    if os.path.exists(path):
+        df = pd.read_csv(path)
         if "Date" not in df.columns:
             df["Date"] = datetime.now().date()  # Add a default date if missing
         else:
@@ -365,26 +618,442 @@ def load_budget_data():
                 df["Date"], format="mixed"
             ).dt.date  # Convert to date only, flexible format
         return df
-    return pd.DataFrame(columns=["Product", "Amount", "Category", "Date"])
+    return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+
+# The parse_* loaders below are cached process-wide on the file signature,
+# so a new session costs no file I/O unless the file changed. st.cache_data
+# hands every caller its own copy, so sessions can mutate the result freely.
+# Every save changes the signature, so entries are bounded in number and age
+
+
+@st.cache_data(max_entries=PARSE_CACHE_MAX_ENTRIES, ttl=PARSE_CACHE_TTL)
+def parse_product_categories(path, signature):
+    if signature is None:
+        return {}  # Return an empty dictionary if the file doesn't exist
+    df = pd.read_csv(path)
+    products = df["Products"].fillna("").str.split(",")
+    # dict.fromkeys drops duplicates, filter drops empty names
+    return {
+        category: list(dict.fromkeys(filter(None, items)))
+        for category, items in zip(df["Category"], products)
+    }
 
 
 def load_product_categories():
-    if os.path.exists(CATEGORIES_CSV):
-        df = pd.read_csv(CATEGORIES_CSV)
-        categories = {}
-        for _, row in df.iterrows():
-            category = row["Category"]
-            products = row["Products"].split(",") if pd.notna(row["Products"]) else []
-            categories[category] = products
-        return categories
-    return {}  # Return an empty dictionary if the file doesn't exist
+    # New users start from the shared default category catalog
+    path = CATEGORIES_CSV if os.path.exists(CATEGORIES_CSV) else DEFAULT_CATEGORIES_CSV
+    return parse_product_categories(path, file_signature(path))
+
+
+INSERT_LEDGER_SQL = """INSERT INTO ledger (user_id, product, amount, category, date)
+                       VALUES (?, ?, ?, ?, ?)"""
+
+
+def ledger_rows(user_id, items):
+    return [
+        (
+            user_id,
+            item["Product"],
+            float(item["Amount"]),
+            item["Category"],
+            pd.Timestamp(item["Date"]).strftime("%Y-%m-%d"),
+        )
+        for item in items
+    ]
+
+
+def insert_ledger_items(user_id, items):
+    with get_db_pool().connection() as conn:
+        with conn:
+            conn.executemany(INSERT_LEDGER_SQL, ledger_rows(user_id, items))
+
+
+def ledger_query(user_id, start_date=None, end_date=None, categories=None):
+    query = """SELECT product AS Product, amount AS Amount,
+                      category AS Category, date AS Date
+               FROM ledger WHERE user_id = ?"""
+    params = [user_id]
+    # Range filters use the (user_id, date) index
+    if start_date is not None:
+        query += " AND date >= ?"
+        params.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+    if end_date is not None:
+        query += " AND date <= ?"
+        params.append(pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+    if categories:
+        query += f" AND category IN ({', '.join('?' * len(categories))})"
+        params.extend(categories)
+    query += " ORDER BY id"
+    return query, params
+
+
+def load_ledger(user_id, start_date=None, end_date=None):
+    query, params = ledger_query(user_id, start_date, end_date)
+    with get_db_pool().connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    df["Date"] = pd.to_datetime(df["Date"]).dt.date
+    return df
+
+
+def import_budget_csv(user_id, csv_path):
+    # One-shot migration of a budget CSV into the ledger, recorded in
+    # ledger_imports so it never runs twice for the same user and file
+    source = os.path.abspath(csv_path)
+    with get_db_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT 1 FROM ledger_imports WHERE user_id = ? AND source = ?",
+            (user_id, source),
+        )
+        already_imported = c.fetchone() is not None
+    if already_imported or not os.path.exists(csv_path):
+        return 0
+
+    df = load_budget_data(csv_path)
+    insert_ledger_items(user_id, df.to_dict("records"))
+    with get_db_pool().connection() as conn:
+        with conn:
+            conn.execute(
+                "INSERT INTO ledger_imports (user_id, source, imported_at) VALUES (?, ?, ?)",
+                (user_id, source, datetime.now()),
+            )
+    return len(df)
+
+
+def legacy_data_owner():
+    # Account that inherits the household data from before per-user
+    # partitions: the legacy_data_owner setting in app_settings.csv, or else
+    # the first account created
+    username = st.session_state.settings.get("legacy_data_owner")
+    with get_db_pool().connection() as conn:
+        if username:
+            row = conn.execute(SELECT_USER_ACCOUNT_SQL, (username,)).fetchone()
+        else:
+            row = conn.execute("SELECT MIN(id) FROM users").fetchone()
+    return row[0] if row else None
+
+
+def migrate_legacy_data(user_id, user_data_dir):
+    # Once per install, hands the shared CSVs and the ledger rows kept under
+    # LEGACY_USER_ID to their owner. Returns True when it ran for user_id
+    if user_id != legacy_data_owner():
+        return False
+    with file_lock(LEGACY_BUDGET_CSV):
+        with get_db_pool().connection() as conn:
+            migrated = conn.execute(
+                "SELECT 1 FROM ledger_imports WHERE user_id = ? AND source = ?",
+                (user_id, LEGACY_MIGRATION_SOURCE),
+            ).fetchone()
+        if migrated:
+            return False
+        # Installs that never ran the shared ledger import do it now; either
+        # way the rows end up under LEGACY_USER_ID and move below
+        import_budget_csv(LEGACY_USER_ID, LEGACY_BUDGET_CSV)
+        # The shared files stay in place as a backup, and product_categories.csv
+        # remains the catalog new users start from
+        for name in LEGACY_DATA_FILES:
+            target = os.path.join(user_data_dir, name)
+            if os.path.exists(name) and not os.path.exists(target):
+                with open(name, newline="", encoding="utf-8") as f:
+                    atomic_write(target, f.read())
+        with get_db_pool().connection() as conn:
+            with conn:
+                conn.execute(
+                    "UPDATE ledger SET user_id = ? WHERE user_id = ?",
+                    (user_id, LEGACY_USER_ID),
+                )
+                conn.execute(
+                    "INSERT INTO ledger_imports (user_id, source, imported_at) VALUES (?, ?, ?)",
+                    (user_id, LEGACY_MIGRATION_SOURCE, datetime.now()),
+                )
+    return True
+
+
+IMPORT_CHUNK_SIZE = 50000
+IMPORT_CACHE_KIB = 65536  # Page cache while importing; index updates dominate
+STATEMENT_COLUMNS = {
+    "Date": ["date", "transaction date", "posted date", "posting date", "booking date"],
+    "Product": ["product", "description", "payee", "name", "memo", "details"],
+    "Amount": ["amount", "transaction amount", "value"],
+    "Category": ["category"],
+}
+OFX_FIELD = re.compile(r"<(DTPOSTED|TRNAMT|NAME|MEMO)>([^<\r\n]*)", re.IGNORECASE)
+OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.IGNORECASE | re.DOTALL)
+OFX_TRANSACTION_START = re.compile(r"<STMTTRN>", re.IGNORECASE)
+OFX_READ_SIZE = 1 << 16  # Characters per read while scanning OFX files
+INSERT_STATEMENT_SQL = """INSERT OR IGNORE INTO ledger
+                          (user_id, product, amount, category, date, row_hash)
+                          VALUES (?, ?, ?, ?, ?, ?)"""
+
+
+def read_csv_statement(file, chunk_size=IMPORT_CHUNK_SIZE):
+    for chunk in pd.read_csv(file, chunksize=chunk_size):
+        headers = {column.strip().lower(): column for column in chunk.columns}
+        renamed = {}
+        for target, aliases in STATEMENT_COLUMNS.items():
+            for alias in aliases:
+                if alias in headers:
+                    renamed[headers[alias]] = target
+                    break
+        chunk = chunk.rename(columns=renamed)
+        missing = {"Date", "Product", "Amount"} - set(chunk.columns)
+        if missing:
+            raise ValueError(
+                f"Statement is missing columns: {', '.join(sorted(missing))}"
+            )
+        yield chunk[[column for column in LEDGER_COLUMNS if column in chunk.columns]]
+
+
+def read_ofx_statement(file, chunk_size=IMPORT_CHUNK_SIZE):
+    # Scans <STMTTRN> blocks out of a buffer filled in fixed-size reads, so
+    # the file is never fully in memory and line breaks do not matter: many
+    # banks write the whole statement on one line
+    rows = []
+    buffer = ""
+    text = io.TextIOWrapper(file, encoding="utf-8", errors="replace")
+    while True:
+        block = text.read(OFX_READ_SIZE)
+        buffer += block
+        consumed = 0
+        for match in OFX_TRANSACTION.finditer(buffer):
+            transaction = {}
+            for tag, value in OFX_FIELD.findall(match.group(1)):
+                transaction.setdefault(tag.upper(), value.strip())
+            rows.append(
+                {
+                    "Date": transaction.get("DTPOSTED", "")[:8],
+                    "Product": transaction.get("NAME") or transaction.get("MEMO"),
+                    "Amount": transaction.get("TRNAMT"),
+                }
+            )
+            consumed = match.end()
+            if len(rows) >= chunk_size:
+                yield pd.DataFrame(rows)
+                rows = []
+        # Keep an unfinished transaction, or just enough to complete a tag
+        # split across reads
+        opening = OFX_TRANSACTION_START.search(buffer, consumed)
+        if opening is not None:
+            buffer = buffer[opening.start() :]
+        else:
+            buffer = buffer[max(consumed, len(buffer) - len("<STMTTRN>")) :]
+        if not block:
+            break
+    if rows:
+        yield pd.DataFrame(rows)
+
+
+def read_statement(file, file_name):
+    if file_name.lower().endswith((".ofx", ".qfx")):
+        return read_ofx_statement(file)
+    return read_csv_statement(file)
+
+
+def prepare_statement_chunk(chunk, spending_sign, categorize):
+    frame = pd.DataFrame(
+        {
+            "Product": chunk["Product"].astype("string").str.strip(),
+            "Amount": pd.to_numeric(chunk["Amount"], errors="coerce"),
+            "Date": pd.to_datetime(chunk["Date"], format="mixed", errors="coerce"),
+        }
+    )
+    if "Category" in chunk.columns:
+        frame["Category"] = chunk["Category"].astype("string")
+    else:
+        frame["Category"] = pd.Series(pd.NA, index=frame.index, dtype="string")
+    # Keep only spending rows, stored as positive amounts like manual items
+    frame = frame[frame["Amount"] * spending_sign > 0].dropna(
+        subset=["Product", "Amount", "Date"]
+    )
+    frame["Amount"] = frame["Amount"].abs().round(2)
+    uncategorized = frame["Category"].isna()
+    frame.loc[uncategorized, "Category"] = frame.loc[uncategorized, "Product"].map(
+        categorize
+    )
+    return frame
+
+
+def statement_row_hashes(frame, seen_counts):
+    # Hash of date, product, amount and how many identical rows came before
+    # it in the statement, so genuine repeats survive and re-imports do not
+    keys = pd.util.hash_pandas_object(
+        frame[["Date", "Product", "Amount"]], index=False
+    )
+    ordinals = keys.groupby(keys).cumcount() + keys.map(seen_counts).fillna(0).astype(
+        "int64"
+    )
+    seen_counts = seen_counts.add(keys.value_counts(), fill_value=0).astype("int64")
+    hashes = pd.util.hash_pandas_object(
+        pd.DataFrame({"key": keys.to_numpy(), "ordinal": ordinals.to_numpy()}),
+        index=False,
+    )
+    return hashes.to_numpy().view("int64"), seen_counts
+
+
+def import_statement(user_id, chunks, spending_sign, categorize):
+    categories = {}
+
+    def categorize_cached(product):
+        if product not in categories:
+            categories[product] = categorize(product) or "Other"
+        return categories[product]
+
+    with get_db_pool().connection() as conn:
+        cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+        conn.execute(f"PRAGMA cache_size=-{IMPORT_CACHE_KIB}")
+        try:
+            imported, skipped = insert_statement_chunks(
+                conn, user_id, chunks, spending_sign, categorize_cached
+            )
+        finally:
+            conn.execute(f"PRAGMA cache_size={cache_size}")
+    return imported, skipped
+
+
+def insert_statement_chunks(conn, user_id, chunks, spending_sign, categorize):
+    imported = skipped = 0
+    seen_counts = pd.Series(dtype="int64")
+    for chunk in chunks:
+        frame = prepare_statement_chunk(chunk, spending_sign, categorize)
+        hashes, seen_counts = statement_row_hashes(frame, seen_counts)
+        rows = list(
+            zip(
+                [user_id] * len(frame),
+                frame["Product"].tolist(),
+                frame["Amount"].tolist(),
+                frame["Category"].tolist(),
+                frame["Date"].dt.strftime("%Y-%m-%d").tolist(),
+                hashes.tolist(),
+            )
+        )
+        # One transaction per chunk; the unique hash index drops duplicates
+        changes_before = conn.total_changes
+        with conn:
+            conn.executemany(INSERT_STATEMENT_SQL, rows)
+        inserted = conn.total_changes - changes_before
+        imported += inserted
+        skipped += len(rows) - inserted
+    return imported, skipped
+
+
+def upload_statement():
+    st.sidebar.subheader("📥 Import Statement")
+    statement = st.sidebar.file_uploader(
+        "Bank statement (CSV or OFX)", type=["csv", "ofx", "qfx"]
+    )
+    sign = st.sidebar.radio(
+        "Spending amounts are", options=["Positive", "Negative"], horizontal=True
+    )
+    if statement is not None and st.sidebar.button("Import Statement"):
+        try:
+            imported, skipped = import_statement(
+                st.session_state.user_id,
+                read_statement(statement, statement.name),
+                1 if sign == "Positive" else -1,
+                get_category,
+            )
+        except ValueError as error:
+            st.sidebar.error(str(error))
+            return
+        reload_budget_items()
+        st.sidebar.success(
+            f"Imported {imported} items, skipped {skipped} already imported."
+        )
+    st.sidebar.markdown("---")
+
+
+def build_budget_aggregates(df):
+    # Dashboard totals, built once per session and then kept up to date by
+    # update_budget_aggregates as items are appended
+    dates = pd.to_datetime(df["Date"]).dt.normalize()
+    amounts = df["Amount"].astype(float)
+    daily_spend = amounts.groupby(dates).sum()
+    cumulative = daily_spend.cumsum()
+    return {
+        "category_totals": amounts.groupby(df["Category"], observed=True)
+        .sum()
+        .to_dict(),
+        "daily_spend": daily_spend.to_dict(),
+        "cumulative_dates": list(cumulative.index),
+        "cumulative_values": list(cumulative.values),
+        "savings_total": float(amounts[df["Product"] == "Savings"].sum()),
+    }
+
+
+def update_budget_aggregates(aggregates, items):
+    for item in items:
+        amount = float(item["Amount"])
+        date = pd.Timestamp(item["Date"]).normalize()
+        category_totals = aggregates["category_totals"]
+        category_totals[item["Category"]] = (
+            category_totals.get(item["Category"], 0.0) + amount
+        )
+        aggregates["daily_spend"][date] = (
+            aggregates["daily_spend"].get(date, 0.0) + amount
+        )
+        if item["Product"] == "Savings":
+            aggregates["savings_total"] += amount
+
+        # Items dated on or after the last point extend the cumulative series
+        # in place; back-dated items invalidate it until it is next read
+        dates = aggregates["cumulative_dates"]
+        values = aggregates["cumulative_values"]
+        if dates is None:
+            continue
+        if not dates or date > dates[-1]:
+            dates.append(date)
+            values.append((values[-1] if values else 0.0) + amount)
+        elif date == dates[-1]:
+            values[-1] += amount
+        else:
+            aggregates["cumulative_dates"] = None
+            aggregates["cumulative_values"] = None
+
+
+def get_cumulative_spending(aggregates, start_date=None, end_date=None):
+    if aggregates["cumulative_dates"] is None:
+        daily_spend = pd.Series(aggregates["daily_spend"]).sort_index()
+        cumulative = daily_spend.cumsum()
+        aggregates["cumulative_dates"] = list(cumulative.index)
+        aggregates["cumulative_values"] = list(cumulative.values)
+    # The series is sorted by date, so a window is two binary searches
+    dates = aggregates["cumulative_dates"]
+    lo = 0 if start_date is None else bisect.bisect_left(dates, pd.Timestamp(start_date))
+    hi = (
+        len(dates)
+        if end_date is None
+        else bisect.bisect_right(dates, pd.Timestamp(end_date))
+    )
+    return pd.DataFrame(
+        {
+            "Date": dates[lo:hi],
+            "Cumulative Sum": aggregates["cumulative_values"][lo:hi],
+        }
+    )
+
+
+def reload_budget_items():
+    flush_writes()
+    st.session_state.budget_items = ColumnarLedger.from_frame(
+        load_ledger(st.session_state.user_id)
+    )
+    st.session_state.budget_aggregates = build_budget_aggregates(
+        st.session_state.budget_items.to_frame()
+    )
+
 
+def record_budget_items(items):
+    # Reflect items that are already stored in the ledger in this session
+    st.session_state.budget_items.extend(items)
+    update_budget_aggregates(st.session_state.budget_aggregates, items)
 
-def save_budget_data(df):
-    df["Date"] = pd.to_datetime(df["Date"]).dt.strftime(
-        "%Y-%m-%d"
-    )  # Convert to string in YYYY-MM-DD format
-    df.to_csv(BUDGET_CSV, index=False)
+
+def append_budget_items(items):
+    record_budget_items(items)
+    get_write_queue().submit(
+        "ledger", rows=ledger_rows(st.session_state.user_id, items)
+    )
 
 
 def save_product_categories(product_categories):
@@ -395,43 +1064,63 @@ def save_product_categories(product_categories):
         ],
         columns=["Category", "Products"],
     )
-    df.to_csv(CATEGORIES_CSV, index=False)
+    save_csv(df, CATEGORIES_CSV, index=False)
+    st.session_state.product_index = ProductIndex(product_categories)
 
 
 def get_category(product):
-    product = product.lower()
-    for category, items in st.session_state.product_categories.items():
-        if product in items:
-            return category
-    return None
+    return st.session_state.product_index.category(product)
 
 
-def load_monthly_budget():
-    if os.path.exists(MONTHLY_BUDGET_CSV):
-        df = pd.read_csv(MONTHLY_BUDGET_CSV)
+@st.cache_data(max_entries=PARSE_CACHE_MAX_ENTRIES, ttl=PARSE_CACHE_TTL)
+def parse_monthly_budget(path, signature):
+    if signature is not None:
+        df = pd.read_csv(path)
         return df["Monthly Budget"].iloc[0] if not df.empty else 0.0
     return 0.0
 
 
+def load_monthly_budget():
+    return parse_monthly_budget(
+        MONTHLY_BUDGET_CSV, file_signature(MONTHLY_BUDGET_CSV)
+    )
+
+
 def save_monthly_budget(monthly_budget):
-    pd.DataFrame({"Monthly Budget": [monthly_budget]}).to_csv(
-        MONTHLY_BUDGET_CSV, index=False
+    save_csv(
+        pd.DataFrame({"Monthly Budget": [monthly_budget]}),
+        MONTHLY_BUDGET_CSV,
+        index=False,
     )
 
 
-def load_recurring_expenses():
-    if os.path.exists(RECURRING_EXPENSES_CSV):
-        return pd.read_csv(RECURRING_EXPENSES_CSV).to_dict("records")
+@st.cache_data(max_entries=PARSE_CACHE_MAX_ENTRIES, ttl=PARSE_CACHE_TTL)
+def parse_recurring_expenses(path, signature):
+    if signature is not None:
+        return pd.read_csv(path).to_dict("records")
     return []
 
 
+def load_recurring_expenses():
+    return parse_recurring_expenses(
+        RECURRING_EXPENSES_CSV, file_signature(RECURRING_EXPENSES_CSV)
+    )
+
+
 def save_recurring_expenses(recurring_expenses):
-    pd.DataFrame(recurring_expenses).to_csv(RECURRING_EXPENSES_CSV, index=False)
+    save_csv(
+        pd.DataFrame(
+            recurring_expenses, columns=["Product", "Amount", "Category", "Frequency"]
+        ),
+        RECURRING_EXPENSES_CSV,
+        index=False,
+    )
 
 
-def load_savings_goal():
-    if os.path.exists(SAVINGS_GOAL_CSV):
-        df = pd.read_csv(SAVINGS_GOAL_CSV)
+@st.cache_data(max_entries=PARSE_CACHE_MAX_ENTRIES, ttl=PARSE_CACHE_TTL)
+def parse_savings_goal(path, signature):
+    if signature is not None:
+        df = pd.read_csv(path)
         if not df.empty:
             return {
                 "amount": df["Amount"].iloc[0],
@@ -440,30 +1129,46 @@ def load_savings_goal():
     return None
 
 
+def load_savings_goal():
+    return parse_savings_goal(SAVINGS_GOAL_CSV, file_signature(SAVINGS_GOAL_CSV))
+
+
 def save_savings_goal(goal):
-    pd.DataFrame({"Amount": [goal["amount"]], "Date": [goal["date"]]}).to_csv(
-        SAVINGS_GOAL_CSV, index=False
+    save_csv(
+        pd.DataFrame({"Amount": [goal["amount"]], "Date": [goal["date"]]}),
+        SAVINGS_GOAL_CSV,
+        index=False,
     )
 
 
-def load_spending_restrictions():
-    if os.path.exists(SPENDING_RESTRICTIONS_CSV):
-        df = pd.read_csv(SPENDING_RESTRICTIONS_CSV)
-        return {
-            row["Product"]: {"limit": row["Limit"], "period": row["Period"]}
-            for _, row in df.iterrows()
-        }
+@st.cache_data(max_entries=PARSE_CACHE_MAX_ENTRIES, ttl=PARSE_CACHE_TTL)
+def parse_spending_restrictions(path, signature):
+    if signature is not None:
+        df = pd.read_csv(path)
+        return (
+            df.drop_duplicates("Product", keep="last")
+            .set_index("Product")[["Limit", "Period"]]
+            .rename(columns={"Limit": "limit", "Period": "period"})
+            .to_dict("index")
+        )
     return {}
 
 
+def load_spending_restrictions():
+    return parse_spending_restrictions(
+        SPENDING_RESTRICTIONS_CSV, file_signature(SPENDING_RESTRICTIONS_CSV)
+    )
+
+
 def save_spending_restrictions(restrictions):
     df = pd.DataFrame(
         [
             {"Product": product, "Limit": data["limit"], "Period": data["period"]}
             for product, data in restrictions.items()
-        ]
+        ],
+        columns=["Product", "Limit", "Period"],
     )
-    df.to_csv(SPENDING_RESTRICTIONS_CSV, index=False)
+    save_csv(df, SPENDING_RESTRICTIONS_CSV, index=False)
 
 
 def set_monthly_budget():
@@ -479,7 +1184,7 @@ def set_monthly_budget():
         st.session_state.monthly_budget = monthly_budget
         save_monthly_budget(monthly_budget)
         st.sidebar.success("Monthly budget saved!")
-        st.experimental_rerun()
+        rerun()
     st.sidebar.markdown("---")
 
 
@@ -490,19 +1195,103 @@ def manage_categories():
     if st.sidebar.button("Add Category"):
         if new_category and new_emoji:
             full_category_name = f"{new_emoji} {new_category}"
-            st.session_state.product_categories[full_category_name] = []
+            # Keep the products of a category that already exists
+            st.session_state.product_categories.setdefault(full_category_name, [])
             save_product_categories(st.session_state.product_categories)
             st.sidebar.success(f"Category {full_category_name} added!")
-            st.experimental_rerun()
+            rerun()
     st.sidebar.markdown("---")
 
 
+EXPORT_CHUNK_SIZE = 10000
+EXPORT_FORMATS = {
+    "CSV": ("budget_data.csv", "text/csv"),
+    "CSV (gzip)": ("budget_data.csv.gz", "application/gzip"),
+    "Parquet": ("budget_data.parquet", "application/vnd.apache.parquet"),
+}
+
+
+def iter_ledger_chunks(
+    user_id, start_date=None, end_date=None, categories=None, chunk_size=EXPORT_CHUNK_SIZE
+):
+    query, params = ledger_query(user_id, start_date, end_date, categories)
+    with get_db_pool().connection() as conn:
+        yield from pd.read_sql_query(query, conn, params=params, chunksize=chunk_size)
+
+
+def write_ledger_export(chunks, export_format, output):
+    # Writes one chunk at a time, so memory use is bounded by the chunk size
+    # rather than the size of the ledger
+    if export_format == "Parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema(
+            [
+                ("Product", pa.string()),
+                ("Amount", pa.float64()),
+                ("Category", pa.string()),
+                ("Date", pa.date32()),
+            ]
+        )
+        with pq.ParquetWriter(output, schema) as writer:
+            for chunk in chunks:
+                chunk["Date"] = pd.to_datetime(chunk["Date"]).dt.date
+                writer.write_table(
+                    pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                )
+        return
+
+    compressed = None
+    if export_format == "CSV (gzip)":
+        output = compressed = gzip.GzipFile(fileobj=output, mode="wb")
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    header = True
+    for chunk in chunks:
+        chunk.to_csv(text, index=False, header=header)
+        header = False
+    if header:  # Nothing matched the filters
+        pd.DataFrame(columns=LEDGER_COLUMNS).to_csv(text, index=False)
+    text.flush()
+    text.detach()
+    if compressed is not None:
+        compressed.close()
+
+
 def export_data():
-    df = pd.DataFrame(st.session_state.budget_items)
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="budget_data.csv">Download CSV File</a>'
-    st.sidebar.markdown(href, unsafe_allow_html=True)
+    st.sidebar.subheader("📊 Data Export")
+    export_format = st.sidebar.selectbox("Export Format", list(EXPORT_FORMATS))
+    today = datetime.now().date()
+    daily_spend = st.session_state.budget_aggregates["daily_spend"]
+    first_date = min(daily_spend).date() if daily_spend else today
+    date_range = st.sidebar.date_input(
+        "Export Date Range", value=(first_date, max(first_date, today))
+    )
+    categories = st.sidebar.multiselect(
+        "Export Categories (all if empty)",
+        options=list(st.session_state.budget_aggregates["category_totals"]),
+    )
+
+    if st.sidebar.button("Create Data Export"):
+        start_date, end_date = (list(date_range) + [None, None])[:2]
+        if not flush_writes():
+            return
+        chunks = iter_ledger_chunks(
+            st.session_state.user_id, start_date, end_date, categories
+        )
+        file_name, mime = EXPORT_FORMATS[export_format]
+        with tempfile.TemporaryDirectory() as export_dir:
+            export_path = os.path.join(export_dir, file_name)
+            try:
+                with open(export_path, "wb") as output:
+                    write_ledger_export(chunks, export_format, output)
+            except ImportError:
+                st.sidebar.error("Parquet export requires the pyarrow package.")
+                return
+            with open(export_path, "rb") as export_file:
+                st.sidebar.download_button(
+                    "Download Export", data=export_file, file_name=file_name, mime=mime
+                )
 
 
 def add_recurring_expense():
@@ -526,7 +1315,7 @@ def add_recurring_expense():
             st.session_state.recurring_expenses.append(new_expense)
             save_recurring_expenses(st.session_state.recurring_expenses)
             st.sidebar.success("Recurring expense added!")
-            st.experimental_rerun()
+            rerun()
     st.sidebar.markdown("---")
 
 
@@ -557,7 +1346,7 @@ def set_savings_goal():
             st.sidebar.success("Savings goal set!")
         else:
             st.sidebar.error("Please enter a savings goal amount greater than zero.")
-        st.experimental_rerun()
+        rerun()
     st.sidebar.markdown("---")
 
 
@@ -589,16 +1378,14 @@ def add_to_savings():
                 "Category": "Savings",
                 "Date": pd.to_datetime(savings_date),  # Convert to pandas datetime
             }
-            st.session_state.budget_items.append(new_savings)
-            df = pd.DataFrame(st.session_state.budget_items)
-            save_budget_data(df)
+            append_budget_items([new_savings])
 
             # Update the savings goal progress
             if (
                 "savings_goal" in st.session_state
                 and st.session_state.savings_goal is not None
             ):
-                total_savings = df[df["Product"] == "Savings"]["Amount"].sum()
+                total_savings = st.session_state.budget_aggregates["savings_total"]
                 goal = st.session_state.savings_goal
                 if total_savings >= goal["amount"]:
                     st.success(
@@ -613,47 +1400,114 @@ def add_to_savings():
                 st.success(f"{format_currency(savings_amount)} added to savings!")
 
             # Force a rerun to update the display
-            st.experimental_rerun()
+            rerun()
         else:
             st.warning("Please enter an amount greater than zero.")
 
 
-def process_recurring_expenses():
-    today = datetime.now().date()
-    if "last_recurring_check" not in st.session_state:
-        st.session_state.last_recurring_check = today - timedelta(days=1)
-
-    if today > st.session_state.last_recurring_check:
-        for expense in st.session_state.recurring_expenses:
-            if expense["Frequency"] == "Daily":
-                days_to_add = (today - st.session_state.last_recurring_check).days
-            elif expense["Frequency"] == "Weekly":
-                days_to_add = (today - st.session_state.last_recurring_check).days // 7
-            elif expense["Frequency"] == "Monthly":
-                months = (
-                    (today.year - st.session_state.last_recurring_check.year) * 12
-                    + today.month
-                    - st.session_state.last_recurring_check.month
-                )
-                days_to_add = months
-            else:
-                continue  # Skip if frequency is not recognized
-
-            for _ in range(days_to_add):
-                new_item = {
+RECURRING_STEPS = {"Daily": "D", "Weekly": "7D"}
+
+
+def recurring_expense_key(expense):
+    return f"{expense['Product']}|{expense['Category']}|{expense['Frequency']}"
+
+
+def recurring_schedule(anchor, frequency, end):
+    # Due dates from anchor through end. Monthly dates keep the anchor's day
+    # of month, clamped to the length of shorter months.
+    if frequency == "Monthly":
+        months = pd.period_range(anchor, end, freq="M")
+        days = np.minimum(anchor.day, months.days_in_month)
+        dates = months.to_timestamp() + pd.to_timedelta(days - 1, unit="D")
+        return dates[dates <= end]
+    return pd.date_range(anchor, end, freq=RECURRING_STEPS[frequency])
+
+
+def recurring_occurrences(expenses, watermarks, today):
+    # All occurrences due after each expense's last posting up to and
+    # including today, dated on the day they fell due, plus the new
+    # (anchor, last_posted) watermarks
+    frames = []
+    new_watermarks = {}
+    for expense in expenses:
+        if expense["Frequency"] not in ("Daily", "Weekly", "Monthly"):
+            continue  # Skip if frequency is not recognized
+        key = recurring_expense_key(expense)
+        # An expense seen for the first time is first due today
+        anchor, last_posted = watermarks.get(key, (today, None))
+        dates = recurring_schedule(anchor, expense["Frequency"], today)
+        if last_posted is not None:
+            dates = dates[dates > last_posted]
+        if len(dates) == 0:
+            continue
+        frames.append(
+            pd.DataFrame(
+                {
                     "Product": expense["Product"],
-                    "Amount": expense["Amount"],
+                    "Amount": float(expense["Amount"]),
                     "Category": expense["Category"],
-                    "Date": today,
+                    "Date": dates,
                 }
-                st.session_state.budget_items.append(new_item)
+            )
+        )
+        new_watermarks[key] = (anchor, dates[-1])
+    if not frames:
+        return pd.DataFrame(columns=LEDGER_COLUMNS), new_watermarks
+    return pd.concat(frames, ignore_index=True), new_watermarks
+
+
+def post_recurring_expenses(user_id, expenses, today):
+    with get_db_pool().connection() as conn:
+        with conn:
+            # Take the write lock before reading the watermarks so two
+            # sessions of the same user cannot post an occurrence twice
+            conn.execute("BEGIN IMMEDIATE")
+            c = conn.cursor()
+            c.execute(
+                """SELECT expense_key, anchor, last_posted FROM recurring_watermarks
+                   WHERE user_id = ?""",
+                (user_id,),
+            )
+            watermarks = {
+                key: (pd.Timestamp(anchor), pd.Timestamp(last_posted))
+                for key, anchor, last_posted in c.fetchall()
+            }
+            occurrences, new_watermarks = recurring_occurrences(
+                expenses, watermarks, today
+            )
+            c.executemany(
+                INSERT_LEDGER_SQL,
+                ledger_rows(user_id, occurrences.to_dict("records")),
+            )
+            c.executemany(
+                """INSERT OR REPLACE INTO recurring_watermarks
+                   (user_id, expense_key, anchor, last_posted) VALUES (?, ?, ?, ?)""",
+                [
+                    (
+                        user_id,
+                        key,
+                        anchor.strftime("%Y-%m-%d"),
+                        last_posted.strftime("%Y-%m-%d"),
+                    )
+                    for key, (anchor, last_posted) in new_watermarks.items()
+                ],
+            )
+    return occurrences
 
-        # Save the updated budget items
-        df = pd.DataFrame(st.session_state.budget_items)
-        save_budget_data(df)
 
-        # Update the last check date
-        st.session_state.last_recurring_check = today
+def process_recurring_expenses():
+    today = pd.Timestamp(datetime.now().date())
+    # The watermarks are stored per user in the database; this only skips
+    # the check on later reruns of the same day
+    if st.session_state.get("recurring_checked_on") == today:
+        return
+
+    occurrences = post_recurring_expenses(
+        st.session_state.user_id, st.session_state.recurring_expenses, today
+    )
+    if not occurrences.empty:
+        record_budget_items(occurrences.to_dict("records"))
+    st.session_state.recurring_checked_on = today
 
 
 def display_savings_goal_progress():
@@ -662,8 +1516,7 @@ def display_savings_goal_progress():
     if "savings_goal" in st.session_state and st.session_state.savings_goal is not None:
         st.subheader("Savings Goal Progress")
         goal = st.session_state.savings_goal
-        df = pd.DataFrame(st.session_state.budget_items)
-        total_savings = df[df["Product"] == "Savings"]["Amount"].sum()
+        total_savings = st.session_state.budget_aggregates["savings_total"]
 
         if goal["amount"] > 0:
             progress = min(
@@ -700,7 +1553,7 @@ def manage_spending_restrictions():
     product = st.sidebar.selectbox(
         "Select Product",
         options=[""]
-        + list(set([item["Product"] for item in st.session_state.budget_items])),
+        + st.session_state.budget_items.products(),
     )
     if product:
         existing_restriction = st.session_state.spending_restrictions.get(product, {})
@@ -734,48 +1587,64 @@ def manage_spending_restrictions():
     st.sidebar.markdown("---")
 
 
+def budget_item_styles(df, over_limit):
+    styles = pd.DataFrame("", index=df.index, columns=df.columns)
+    styles.loc[over_limit.to_numpy(), :] = "color: red"
+    styles.loc[(df["Product"] == "Savings").to_numpy(), :] = "color: green"
+    return styles
+
+
+def display_restriction_alerts(df, over_limit):
+    # Warn about restricted products that are over their limit in the current period
+    restrictions = st.session_state.spending_restrictions
+    flagged = df[over_limit]
+    if flagged.empty:
+        return
+    today = pd.Series(pd.Timestamp(datetime.now().date()), index=flagged.index)
+    periods = flagged["Product"].map(
+        {product: restriction["period"] for product, restriction in restrictions.items()}
+    )
+    current = flagged[flagged["Date"] >= restriction_period_starts(today, periods)]
+    for product in current["Product"].unique():
+        restriction = restrictions[product]
+        st.warning(
+            f"{product} is over its {restriction['period'].lower()} limit of {format_currency(restriction['limit'])}"
+        )
+
+
+HISTORY_WINDOW_DAYS = 90  # Default span of the budget items table
+
+
+def query_with_restrictions(ledger, start_date=None, end_date=None):
+    # Items in the window plus their over-limit flags; rows from the start of
+    # the enclosing restriction periods are queried too so totals are right
+    restrictions = st.session_state.spending_restrictions
+    lookback = None if start_date is None else restriction_lookback(start_date)
+    df = ledger.query(start_date=lookback, end_date=end_date)
+    over_limit = compute_restriction_mask(df, restrictions)
+    if start_date is not None:
+        in_window = (df["Date"] >= pd.Timestamp(start_date)).to_numpy()
+        df, over_limit = df[in_window], over_limit[in_window]
+    return df, over_limit
+
+
 def display_budget_items():
     st.subheader("📜 Budget Items History")
 
-    if st.session_state.budget_items:
-        df = pd.DataFrame(st.session_state.budget_items)
-        df["Date"] = pd.to_datetime(df["Date"])
-        df.index = range(1, len(df) + 1)
-
-        def color_savings(val):
-            color = "green" if val == "Savings" else ""
-            return f"color: {color}"
-
-        def color_amount(val, row):
-            if row["Product"] == "Savings":
-                return "color: green"
-            elif row["Product"] in st.session_state.spending_restrictions:
-                restriction = st.session_state.spending_restrictions[row["Product"]]
-                date = pd.Timestamp(row["Date"])
-
-                if restriction["period"] == "Daily":
-                    total_spent = df[
-                        (df["Product"] == row["Product"]) & (df["Date"] == row["Date"])
-                    ]["Amount"].sum()
-                elif restriction["period"] == "Weekly":
-                    date = pd.Timestamp(row["Date"])
-                    week_start = date - pd.Timedelta(days=date.dayofweek)
-                    total_spent = df[
-                        (df["Product"] == row["Product"])
-                        & (df["Date"] >= week_start)
-                        & (df["Date"] <= row["Date"])
-                    ]["Amount"].sum()
-                else:  # Monthly
-                    month_start = row["Date"].replace(day=1)
-                    total_spent = df[
-                        (df["Product"] == row["Product"])
-                        & (df["Date"] >= month_start)
-                        & (df["Date"] <= row["Date"])
-                    ]["Amount"].sum()
-
-                if total_spent > restriction["limit"]:
-                    return "color: red"
-            return ""
+    ledger = st.session_state.budget_items
+    if ledger:
+        first_date, last_date = (date.date() for date in ledger.date_span())
+        window = st.date_input(
+            "Show items between",
+            value=(
+                max(first_date, last_date - timedelta(days=HISTORY_WINDOW_DAYS)),
+                last_date,
+            ),
+            min_value=first_date,
+            max_value=last_date,
+        )
+        start_date, end_date = (list(window) + [last_date, last_date])[:2]
+        df, over_limit = query_with_restrictions(ledger, start_date, end_date)
 
         st.dataframe(
             df.style.format(
@@ -783,13 +1652,18 @@ def display_budget_items():
                     "Amount": lambda x: format_currency(x),
                     "Date": lambda x: x.strftime("%Y-%m-%d"),
                 }
-            )
-            .applymap(color_savings, subset=["Product"])
-            .apply(lambda row: [color_amount(val, row) for val in row], axis=1)
+            ).apply(lambda _: budget_item_styles(df, over_limit), axis=None)
+        )
+        # Alerts are about the current periods, whatever window is shown:
+        # every item since the earliest period start that contains today
+        current = ledger.query(start_date=restriction_lookback(datetime.now().date()))
+        display_restriction_alerts(
+            current,
+            compute_restriction_mask(current, st.session_state.spending_restrictions),
         )
 
         # Calculate and display total
-        total = df["Amount"].sum()
+        total = sum(st.session_state.budget_aggregates["category_totals"].values())
         st.markdown(f"***Sum of spendings: {format_currency(total)}***")
     else:
         st.info("No budget items added yet.")
@@ -798,14 +1672,10 @@ def display_budget_items():
 def display_budget_vs_actual():
     if "monthly_budget" in st.session_state:
         st.subheader("Budget vs. Actual Spending")
-        current_month = datetime.now().replace(day=1).date()
-        df = pd.DataFrame(st.session_state.budget_items)
-        df["Date"] = pd.to_datetime(df["Date"])
-
-        # Convert current_month to datetime64[ns] for comparison
-        current_month = pd.to_datetime(current_month)
-
-        monthly_spending = df[df["Date"] >= current_month]["Amount"].sum()
+        current_month = pd.Period(datetime.now(), freq="M")
+        monthly_spending = st.session_state.budget_items.totals(
+            start_date=current_month.start_time
+        )
         remaining_budget = st.session_state.monthly_budget - monthly_spending
 
         col1, col2, col3, col4 = st.columns(4)
@@ -814,17 +1684,108 @@ def display_budget_vs_actual():
         col3.metric("Remaining", format_currency(remaining_budget))
 
         # Create a progress bar to show budget remaining
-        progress = remaining_budget / st.session_state.monthly_budget
+        if st.session_state.monthly_budget > 0:
+            progress = remaining_budget / st.session_state.monthly_budget
+        else:
+            progress = 0.0
+        progress = min(max(progress, 0.0), 1.0)
         col4.text(f"Budget Remaing")
         col4.progress(progress, text=f"{progress:.1%}")
 
+        if st.session_state.budget_items:
+            display_spend_forecast()
+
     st.markdown("---")
 
 
+FORECAST_WORKERS = 2  # Processes fitting per-category spend models
+
+
+@st.cache_resource
+def get_forecast_engine():
+    engine = ForecastEngine(max_workers=FORECAST_WORKERS)
+    atexit.register(engine.shutdown)
+    return engine
+
+
+def spending_history(ledger, current_month):
+    # Past months only change when items are added, so the history is kept
+    # until the ledger grows or the month turns
+    key = (len(ledger), current_month)
+    cached = st.session_state.get("forecast_history")
+    if cached is None or cached[0] != key:
+        df = ledger.query(end_date=(current_month - 1).end_time)
+        cached = (key, monthly_history(df, current_month))
+        st.session_state.forecast_history = cached
+    return cached[1]
+
+
+def display_spend_forecast():
+    ledger = st.session_state.budget_items
+    today = datetime.now().date()
+    current_month = pd.Period(today, freq="M")
+    history = spending_history(ledger, current_month)
+    if not history:
+        return  # No complete month to learn from yet
+
+    # Models are cached until a category's history changes, so only the
+    # first run after a month completes pays for fitting
+    with st.spinner("Fitting spending models..."):
+        models = get_forecast_engine().models(history)
+    this_month = ledger.query(start_date=current_month.start_time)
+    month_to_date = (
+        this_month["Amount"].groupby(this_month["Category"], observed=True).sum()
+    ).to_dict()
+    projection = project_month_end(models, month_to_date, today)
+
+    projected = projection["Projected"].sum()
+    monthly_budget = st.session_state.monthly_budget
+    over_budget = projected - monthly_budget
+    sign = "+" if over_budget >= 0 else "-"
+    st.metric(
+        "Projected Month-End Spend",
+        format_currency(projected),
+        delta=(
+            f"{sign}{format_currency(abs(over_budget))} vs. budget"
+            if monthly_budget > 0
+            else None
+        ),
+        delta_color="inverse",
+    )
+    if monthly_budget > 0 and over_budget > 0:
+        st.warning(
+            f"At this pace you will exceed this month's budget by {format_currency(over_budget)}."
+        )
+    for category in projection.loc[projection["Unusual"], "Category"]:
+        st.warning(f"{category} spending this month is well above its usual level.")
+
+    with st.expander("Forecast details"):
+        st.dataframe(
+            projection.drop(columns="Unusual").style.format(
+                {
+                    column: lambda x: format_currency(x)
+                    for column in ["Spent", "Forecast", "Projected"]
+                }
+            ),
+            hide_index=True,
+        )
+        flagged = unusual_months(history, models)
+        if flagged:
+            st.markdown(
+                "Unusual months: "
+                + ", ".join(
+                    f"{category} {month} ({format_currency(amount)})"
+                    for category, month, amount in flagged
+                )
+            )
+
+
 def display_pie_chart():
     if st.session_state.budget_items:
-        df = pd.DataFrame(st.session_state.budget_items)
-        category_totals = df.groupby("Category")["Amount"].sum().reset_index()
+        category_totals = pd.DataFrame(
+            list(st.session_state.budget_aggregates["category_totals"].items()),
+            columns=["Category", "Amount"],
+        )
         total_spending = category_totals["Amount"].sum()
         category_totals["Percentage"] = category_totals["Amount"] / total_spending * 100
 
@@ -842,6 +1803,8 @@ def display_pie_chart():
             lambda row: format_label(row["Category"], row["Percentage"]), axis=1
         )
 
+        import plotly.express as px  # Deferred until a chart renders
+
         fig = px.pie(
             category_totals,
             values="Amount",
@@ -861,10 +1824,23 @@ def display_pie_chart():
 
 def display_spending_chart():
     if st.session_state.budget_items:
-        df = pd.DataFrame(st.session_state.budget_items)
-        df["Date"] = pd.to_datetime(df["Date"])
-        df = df.sort_values("Date")
-        df["Cumulative Sum"] = df["Amount"].cumsum()
+        import plotly.express as px  # Deferred until a chart renders
+
+        aggregates = st.session_state.budget_aggregates
+        first_date = min(aggregates["daily_spend"]).date()
+        last_date = max(aggregates["daily_spend"]).date()
+        window = (first_date, last_date)
+        if first_date < last_date:
+            # Narrowing the window re-queries at up to daily resolution
+            window = st.slider(
+                "Chart window",
+                min_value=first_date,
+                max_value=last_date,
+                value=(first_date, last_date),
+            )
+        df = downsample_series(
+            get_cumulative_spending(aggregates, *window), "Date", "Cumulative Sum"
+        )
         fig = px.line(
             df, x="Date", y="Cumulative Sum", title="Cumulative Spending Over Time"
         )
@@ -936,62 +1912,100 @@ def set_currency():
         "logged_in", False
     ):
         st.session_state.currency = selected_currency
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute(
-            "UPDATE users SET currency = ? WHERE username = ?",
-            (selected_currency, st.session_state.username),
-        )
-        conn.commit()
-        conn.close()
+        with get_db_pool().connection() as conn:
+            with conn:
+                conn.execute(
+                    UPDATE_CURRENCY_SQL, (selected_currency, st.session_state.username)
+                )
+        get_session_cache().invalidate_user(st.session_state.username)
         st.sidebar.success(f"Currency updated to {selected_currency}")
-        st.experimental_rerun()
+        rerun()
+
+
+def main():
+    start_session_sweeper(get_db_pool())
+    get_write_queue()  # Replays anything a crash left in the journal
+    check_session()
+
+
+if "logged_in" not in st.session_state:
+    st.session_state.logged_in = False
+if "username" not in st.session_state:
+    st.session_state.username = None
+if "show_login_form" not in st.session_state:
+    st.session_state.show_login_form = False
+if "show_signup_form" not in st.session_state:
+    st.session_state.show_signup_form = False
 
+if __name__ == "__main__":
+    main()
 
 display_sidebar()
 
 # Main script execution
 st.title("🏠 Household Budget Tracker")
 
-# File paths for CSV
-BUDGET_CSV = "budget_data.csv"
-CATEGORIES_CSV = "product_categories.csv"
-MONTHLY_BUDGET_CSV = "monthly_budget.csv"
-RECURRING_EXPENSES_CSV = "recurring_expenses.csv"
-SAVINGS_GOAL_CSV = "savings_goal.csv"
-SPENDING_RESTRICTIONS_CSV = "spending_restrictions.csv"
+if not st.session_state.logged_in:
+    st.info("Please log in or sign up to use the budget tracker.")
+    st.stop()
+
+# Nothing above needs pandas or numpy, so the login form paints without
+# paying for them; profile_imports.py keeps it that way
+import pandas as pd
+import numpy as np
+from budget_forecast import (
+    ForecastEngine,
+    monthly_history,
+    project_month_end,
+    unusual_months,
+)
+from charts import downsample_series
+from ledger import ColumnarLedger
+from product_index import ProductIndex, normalize_product
+from restrictions import (
+    compute_restriction_mask,
+    restriction_lookback,
+    restriction_period_starts,
+)
+
+# File paths for CSV, partitioned per user
+USER_DATA_DIR = os.path.join(DATA_DIR, str(st.session_state.user_id))
+os.makedirs(USER_DATA_DIR, exist_ok=True)
+CATEGORIES_CSV = os.path.join(USER_DATA_DIR, "product_categories.csv")
+MONTHLY_BUDGET_CSV = os.path.join(USER_DATA_DIR, "monthly_budget.csv")
+RECURRING_EXPENSES_CSV = os.path.join(USER_DATA_DIR, "recurring_expenses.csv")
+SAVINGS_GOAL_CSV = os.path.join(USER_DATA_DIR, "savings_goal.csv")
+SPENDING_RESTRICTIONS_CSV = os.path.join(USER_DATA_DIR, "spending_restrictions.csv")
+
+# Drop the previous user's data when a different user logs in
+if st.session_state.get("loaded_user_id") != st.session_state.user_id:
+    for key in USER_STATE_KEYS:
+        st.session_state.pop(key, None)
+    # Another session of this user may still have writes in flight
+    flush_writes()
+    st.session_state.loaded_user_id = st.session_state.user_id
 
 # Initialize session state
 if "budget_items" not in st.session_state:
-    st.session_state.budget_items = load_budget_data().to_dict("records")
+    if migrate_legacy_data(st.session_state.user_id, USER_DATA_DIR):
+        st.info("The household's shared budget data has been moved to your account.")
+    reload_budget_items()
 if "product_categories" not in st.session_state:
     st.session_state.product_categories = load_product_categories()
+if "product_index" not in st.session_state:
+    st.session_state.product_index = ProductIndex(st.session_state.product_categories)
 if "monthly_budget" not in st.session_state:
     st.session_state.monthly_budget = load_monthly_budget()
 if "recurring_expenses" not in st.session_state:
     st.session_state.recurring_expenses = load_recurring_expenses()
 if "savings_goal" not in st.session_state:
     st.session_state.savings_goal = load_savings_goal() or {
-        "amount": 0,
+        "amount": 0.0,
         "date": datetime.now().date(),
     }
 if "spending_restrictions" not in st.session_state:
     st.session_state.spending_restrictions = load_spending_restrictions()
 
-if "logged_in" not in st.session_state:
-    st.session_state.logged_in = False
-if "username" not in st.session_state:
-    st.session_state.username = None
-if "show_login_form" not in st.session_state:
-    st.session_state.show_login_form = False
-if "show_signup_form" not in st.session_state:
-    st.session_state.show_signup_form = False
-
-# Flatten the product list for autocomplete
-all_products = [
-    item for sublist in st.session_state.product_categories.values() for item in sublist
-]
-
 # Call the functions
 set_monthly_budget()
 manage_categories()
@@ -1020,7 +2034,10 @@ col1, col2 = st.columns(2)
 with col1:
     if "recurring_expenses" in st.session_state:
         st.markdown("##### 🔄 Recurring Expenses")
-        rec_df = pd.DataFrame(st.session_state.recurring_expenses)
+        rec_df = pd.DataFrame(
+            st.session_state.recurring_expenses,
+            columns=["Product", "Amount", "Category", "Frequency"],
+        )
 
         # Format the 'Amount' column with currency
         rec_df["Amount"] = rec_df["Amount"].apply(format_currency)
@@ -1044,18 +2061,10 @@ with col2:
 display_savings_goal_progress()
 add_to_savings()
 
-# Add an option to export data
-st.sidebar.subheader("📊 Data Export")
-if st.sidebar.button("Create Data Export"):
-    export_data()
-
-
-def main():
-    if not os.path.exists(DB_FILE):
-        init_db()
-
-    check_session()
+# Add options to import and export data
+upload_statement()
+export_data()
 
+# Hand everything saved during this run to the write-behind queue
+flush_csv_writes()
 
-if __name__ == "__main__":
-    main()
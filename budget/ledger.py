@@ -0,0 +1,192 @@
+# In-memory columnar ledger for household_budget.py: the session's budget
+# items as typed NumPy columns with a sorted date index for range queries.
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnarLedger:
+    # Budget items held as typed columns: float64 amounts, datetime64 dates
+    # and integer codes into product/category label lists. Appends grow the
+    # arrays geometrically, and to_frame wraps them without copying.
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._amounts = np.empty(capacity, dtype="float64")
+        self._dates = np.empty(capacity, dtype="datetime64[ns]")
+        self._product_codes = np.empty(capacity, dtype="int32")
+        self._category_codes = np.empty(capacity, dtype="int32")
+        self._products = []
+        self._product_lookup = {}
+        self._categories = []
+        self._category_lookup = {}
+        # Row positions sorted by date, and the dates in that order, covering
+        # the first _indexed rows
+        self._date_order = np.empty(capacity, dtype="int64")
+        self._sorted_dates = np.empty(capacity, dtype="datetime64[ns]")
+        self._indexed = 0
+
+    @classmethod
+    def from_frame(cls, df):
+        ledger = cls(capacity=max(1024, len(df)))
+        n = len(df)
+        products = pd.Categorical(df["Product"])
+        categories = pd.Categorical(df["Category"])
+        ledger._products = list(products.categories)
+        ledger._product_lookup = {p: i for i, p in enumerate(ledger._products)}
+        ledger._categories = list(categories.categories)
+        ledger._category_lookup = {c: i for i, c in enumerate(ledger._categories)}
+        ledger._product_codes[:n] = products.codes
+        ledger._category_codes[:n] = categories.codes
+        ledger._amounts[:n] = df["Amount"].to_numpy(dtype="float64")
+        ledger._dates[:n] = pd.to_datetime(df["Date"]).to_numpy(
+            dtype="datetime64[ns]"
+        )
+        ledger._size = n
+        return ledger
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def _reserve(self, size):
+        capacity = len(self._amounts)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        for name in (
+            "_amounts",
+            "_dates",
+            "_product_codes",
+            "_category_codes",
+            "_date_order",
+            "_sorted_dates",
+        ):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[: self._size] = old[: self._size]
+            setattr(self, name, new)
+
+    def _code(self, labels, lookup, label):
+        code = lookup.get(label)
+        if code is None:
+            code = lookup[label] = len(labels)
+            labels.append(label)
+        return code
+
+    def extend(self, items):
+        self._reserve(self._size + len(items))
+        for item in items:
+            i = self._size
+            self._amounts[i] = float(item["Amount"])
+            self._dates[i] = pd.Timestamp(item["Date"]).to_datetime64()
+            self._product_codes[i] = self._code(
+                self._products, self._product_lookup, item["Product"]
+            )
+            self._category_codes[i] = self._code(
+                self._categories, self._category_lookup, item["Category"]
+            )
+            self._size += 1
+
+    def append(self, item):
+        self.extend([item])
+
+    def products(self):
+        return list(self._products)
+
+    def _sorted_index(self):
+        # Rows appended in date order extend the index; a back-dated row
+        # costs one stable re-sort on the next query
+        n, indexed = self._size, self._indexed
+        if indexed < n:
+            new_dates = self._dates[indexed:n]
+            in_order = bool(np.all(new_dates[1:] >= new_dates[:-1])) and (
+                indexed == 0 or new_dates[0] >= self._sorted_dates[indexed - 1]
+            )
+            if in_order:
+                self._date_order[indexed:n] = np.arange(indexed, n)
+                self._sorted_dates[indexed:n] = new_dates
+            else:
+                self._date_order[:n] = np.argsort(self._dates[:n], kind="stable")
+                self._sorted_dates[:n] = self._dates[self._date_order[:n]]
+            self._indexed = n
+        return self._date_order[:n], self._sorted_dates[:n]
+
+    def date_span(self):
+        # (first, last) item dates, or None for an empty ledger
+        _, dates = self._sorted_index()
+        if not len(dates):
+            return None
+        return pd.Timestamp(dates[0]), pd.Timestamp(dates[-1])
+
+    def positions(self, start_date=None, end_date=None, categories=None, products=None):
+        # Row positions of items dated within [start_date, end_date] (whole
+        # days, either end open) and in the given categories/products, in
+        # insertion order. Costs O(log n) plus the size of the date window
+        order, dates = self._sorted_index()
+        lo, hi = 0, len(order)
+        if start_date is not None:
+            start = np.datetime64(pd.Timestamp(start_date).normalize(), "ns")
+            lo = np.searchsorted(dates, start, side="left")
+        if end_date is not None:
+            end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+            hi = np.searchsorted(dates, np.datetime64(end, "ns"), side="left")
+        if lo == 0 and hi == len(order):
+            positions = np.arange(len(order))
+        else:
+            positions = np.sort(order[lo:hi])
+        for labels, lookup, codes in (
+            (categories, self._category_lookup, self._category_codes),
+            (products, self._product_lookup, self._product_codes),
+        ):
+            if labels:
+                wanted = [lookup[label] for label in labels if label in lookup]
+                positions = positions[np.isin(codes[positions], wanted)]
+        return positions
+
+    def query(self, start_date=None, end_date=None, categories=None, products=None):
+        # Matching items as a frame indexed by 1-based row number
+        positions = self.positions(start_date, end_date, categories, products)
+        return pd.DataFrame(
+            {
+                "Product": pd.Categorical.from_codes(
+                    self._product_codes[positions], categories=self._products
+                ),
+                "Amount": self._amounts[positions],
+                "Category": pd.Categorical.from_codes(
+                    self._category_codes[positions], categories=self._categories
+                ),
+                "Date": self._dates[positions],
+            },
+            index=positions + 1,
+        )
+
+    def totals(
+        self, freq=None, start_date=None, end_date=None, categories=None, products=None
+    ):
+        # Sum of matching amounts, or a Series of sums per "D", "W" or "M" period
+        positions = self.positions(start_date, end_date, categories, products)
+        amounts = self._amounts[positions]
+        if freq is None:
+            return float(amounts.sum())
+        periods = pd.DatetimeIndex(self._dates[positions]).to_period(freq)
+        return pd.Series(amounts).groupby(periods).sum()
+
+    def to_frame(self):
+        # Read-only view over the current columns; callers that want to
+        # modify values in place should copy first
+        n = self._size
+        return pd.DataFrame(
+            {
+                "Product": pd.Categorical.from_codes(
+                    self._product_codes[:n], categories=self._products
+                ),
+                "Amount": self._amounts[:n],
+                "Category": pd.Categorical.from_codes(
+                    self._category_codes[:n], categories=self._categories
+                ),
+                "Date": self._dates[:n],
+            },
+            copy=False,
+        )
@@ -0,0 +1,115 @@
+# Product name -> category lookup for household_budget.py, with plural
+# stemming and a trigram index for near matches.
+
+import bisect
+
+import numpy as np
+
+
+FUZZY_MATCH_THRESHOLD = 0.65  # Minimum trigram Dice similarity
+
+
+def normalize_product(product):
+    return " ".join(product.lower().split())
+
+
+def stem_word(word):
+    # Light plural stripping: berries -> berry, tomatoes -> tomato, eggs -> egg
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ches", "shes", "xes", "sses")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def stem_product(product):
+    return " ".join(stem_word(word) for word in normalize_product(product).split())
+
+
+def product_trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    # Normalized product name -> category, plus the names in sorted order
+    # for prefix lookups. Unknown names fall back to their stem and then to
+    # the most similar stem in a trigram index, built on first use.
+    def __init__(self, product_categories):
+        self._categories = {}
+        self._stems = {}
+        for category, products in product_categories.items():
+            for product in products:
+                # The first category listing a product wins, as the old
+                # linear scan did
+                self._categories.setdefault(normalize_product(product), category)
+                self._stems.setdefault(stem_product(product), category)
+        self._sorted = sorted(self._categories)
+        self._trigrams = None
+
+    def _build_trigrams(self):
+        names = list(self._stems)
+        sizes = np.empty(len(names), dtype="int32")
+        words = np.empty(len(names), dtype="int32")
+        postings = {}
+        for i, name in enumerate(names):
+            grams = product_trigrams(name)
+            sizes[i] = len(grams)
+            words[i] = name.count(" ") + 1
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        postings = {gram: np.array(ids, dtype="int32") for gram, ids in postings.items()}
+        self._trigrams = (names, sizes, words, postings)
+
+    def closest(self, product, threshold=FUZZY_MATCH_THRESHOLD):
+        # Known product stem with the highest trigram Dice similarity among
+        # those with as many words. A typo keeps the word count; an extra
+        # word usually names a different thing ("coffee table", "phone case")
+        query = stem_product(product)
+        if len(query) < 3 or not self._stems:
+            return None
+        if self._trigrams is None:
+            self._build_trigrams()
+        names, sizes, words, postings = self._trigrams
+        grams = product_trigrams(query)
+        hits = [postings[gram] for gram in grams if gram in postings]
+        if not hits:
+            return None
+        shared = np.bincount(np.concatenate(hits), minlength=len(names))
+        scores = 2 * shared / (len(grams) + sizes)
+        scores[words != query.count(" ") + 1] = 0
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        return names[best]
+
+    def __contains__(self, product):
+        return normalize_product(product) in self._categories
+
+    def category(self, product, exact=False):
+        # With exact=True only names in the catalog resolve; otherwise the
+        # stem and near matches are guesses the caller should let users check
+        key = normalize_product(product)
+        if not key:
+            return None
+        category = self._categories.get(key)
+        if category is not None or exact:
+            return category
+        category = self._stems.get(stem_product(key))
+        if category is None:
+            match = self.closest(key)
+            if match is not None:
+                category = self._stems[match]
+        return category
+
+    def with_prefix(self, prefix, limit=10):
+        prefix = normalize_product(prefix)
+        start = bisect.bisect_left(self._sorted, prefix)
+        matches = []
+        for product in self._sorted[start : start + limit]:
+            if not product.startswith(prefix):
+                break
+            matches.append(product)
+        return matches
@@ -0,0 +1,105 @@
+"""Import-time profile of household_budget.py's login page.
+
+Runs the imports that execute before the login gate under ``python -X importtime``
+in fresh interpreters and reports the cost, so time-to-first-paint
+regressions show up before they ship:
+
+    python budget/profile_imports.py
+    python budget/profile_imports.py --budget-ms 1200 --top 15
+
+Exits non-zero if the best run exceeds the budget or if a deferred module
+(pandas, numpy, plotly.express, ...) is imported before the gate.
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "household_budget.py")
+DEFERRED = ["pandas", "numpy", "plotly.express", "pyarrow"]
+DEFAULT_BUDGET_MS = 1000
+DEFAULT_REPEATS = 5
+
+
+def is_login_gate(node):
+    # The `if not st.session_state.logged_in:` block that stops logged-out runs
+    return isinstance(node, ast.If) and "logged_in" in ast.unparse(node.test)
+
+
+def has_import(node):
+    return any(isinstance(n, (ast.Import, ast.ImportFrom)) for n in ast.walk(node))
+
+
+def pre_gate_imports(path=APP):
+    # Source of every module-level import statement above the login gate
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    statements = []
+    for node in tree.body:
+        if is_login_gate(node):
+            break
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.Try)) and has_import(
+            node
+        ):
+            statements.append(ast.unparse(node))
+    return "\n".join(statements)
+
+
+def parse_importtime(stderr):
+    # Rows of (module, self_us, cumulative_us, depth) from -X importtime
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile_once(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(APP),  # streamlit puts the app's directory on sys.path
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    code = pre_gate_imports()
+    # Keep the fastest run; slower ones only measure noise
+    runs = [profile_once(code) for _ in range(args.repeats)]
+    rows = min(runs, key=lambda r: sum(row[2] for row in r if row[3] == 0))
+    total_ms = sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000
+
+    print(f"Imports before the login gate: {total_ms:.0f} ms (best of {args.repeats})")
+    print(f"{'module':40} {'cumulative ms':>14}")
+    top_level = sorted((row for row in rows if row[3] == 0), key=lambda r: -r[2])
+    for name, _, cumulative, _ in top_level[: args.top]:
+        print(f"{name:40} {cumulative / 1000:14.1f}")
+
+    imported = {name for name, _, _, _ in rows}
+    leaked = [module for module in DEFERRED if module in imported]
+    failed = False
+    if leaked:
+        print(f"FAIL: deferred modules imported before the gate: {', '.join(leaked)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: {total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
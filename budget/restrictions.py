@@ -0,0 +1,59 @@
+# Spending-restriction checks for household_budget.py, kept out of the
+# Streamlit script so benchmark_restrictions.py can import them.
+
+import pandas as pd
+
+
+def restriction_period_starts(dates, periods):
+    # Start of the Daily/Weekly/Monthly window each date falls into
+    dates = dates.dt.normalize()
+    week_starts = dates - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+    month_starts = dates.dt.to_period("M").dt.to_timestamp()
+    return dates.where(
+        periods == "Daily", week_starts.where(periods == "Weekly", month_starts)
+    )
+
+
+def compute_restriction_mask(df, restrictions):
+    # Flag rows whose product total from the start of its restriction period up
+    # to (and including) the row's date exceeds the limit. One grouped cumulative
+    # sum over all restricted rows instead of re-filtering the frame per row.
+    mask = pd.Series(False, index=df.index)
+    if df.empty or not restrictions:
+        return mask
+
+    limits = pd.DataFrame.from_dict(restrictions, orient="index")
+    restricted = df[df["Product"].isin(limits.index)]
+    if restricted.empty:
+        return mask
+
+    dates = pd.to_datetime(restricted["Date"]).dt.normalize()
+    periods = restricted["Product"].map(limits["period"])
+    keys = pd.DataFrame(
+        {
+            "Product": restricted["Product"],
+            "Start": restriction_period_starts(dates, periods),
+            "Date": dates,
+        }
+    )
+
+    daily_totals = (
+        restricted["Amount"]
+        .groupby([keys["Product"], keys["Start"], keys["Date"]], observed=True)
+        .sum()
+    )
+    running_totals = daily_totals.groupby(
+        level=["Product", "Start"], observed=True
+    ).cumsum()
+    row_totals = running_totals.reindex(pd.MultiIndex.from_frame(keys)).to_numpy()
+
+    row_limits = restricted["Product"].map(limits["limit"]).astype(float).to_numpy()
+    mask.loc[restricted.index] = row_totals > row_limits
+    return mask
+
+
+def restriction_lookback(start_date):
+    # Earliest restriction period start (week or month) covering start_date
+    start_date = pd.Timestamp(start_date).normalize()
+    week_start = start_date - pd.Timedelta(days=start_date.dayofweek)
+    return min(week_start, start_date.replace(day=1))
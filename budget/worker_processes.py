@@ -0,0 +1,53 @@
+# Worker process start-up for the process pools of the Streamlit apps
+# (budget_forecast.ForecastEngine, arima_selection.grid_search). Imported
+# as worker_processes by household_budget.py and as budget.worker_processes
+# from the repository root.
+
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from multiprocessing import spawn
+
+_local = threading.local()
+
+
+def _preparation_data(name, _original=spawn.get_preparation_data):
+    data = _original(name)
+    if getattr(_local, "skip_main", False):
+        data.pop("init_main_from_path", None)
+        data.pop("init_main_from_name", None)
+    return data
+
+
+# Consulted by multiprocessing each time it starts a non-fork process.
+# Outside app_script_not_rerun() the result is unchanged
+spawn.get_preparation_data = _preparation_data
+
+
+@contextmanager
+def app_script_not_rerun():
+    # Streamlit runs the app as a __main__ module with no spec, whose
+    # __file__ is the script, and a worker not started by a plain fork
+    # re-executes __main__ from that path before it runs anything. Workers
+    # started by this thread inside the block leave __main__ alone instead.
+    # The flag is per thread rather than set on __main__ itself, because
+    # Streamlit swaps sys.modules["__main__"] on every script run, from
+    # whichever session's thread reruns. Pools must therefore start their
+    # workers in submit(), which they do without max_tasks_per_child
+    previous = getattr(_local, "skip_main", False)
+    _local.skip_main = True
+    try:
+        yield
+    finally:
+        _local.skip_main = previous
+
+
+def forkserver_context(preload):
+    # forkserver, not fork: forking the threaded Streamlit server can copy a
+    # lock some other thread holds into the child. The server imports the
+    # preload modules once, so each worker forks from a process that already
+    # has them. The forkserver is one per process and keeps the preload list
+    # of whichever pool starts it first
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(preload)
+    return context
@@ -0,0 +1,430 @@
+# Durable writes for household_budget.py: atomic file replacement under a
+# cross-process lock, and a journaled write-behind queue that persists
+# ledger inserts and CSV writes off the request thread.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; writes are still atomic, just unlocked
+    fcntl = None
+
+WRITE_BEHIND_MAX_LAG = 0.5  # Seconds a mutation may wait to be persisted
+WRITE_BEHIND_FLUSH_TIMEOUT = 10.0  # Seconds flush() waits before giving up
+WRITE_BEHIND_MAX_ATTEMPTS = 5  # Failed applies before an op is set aside
+JOURNAL_TAG_LENGTH = 8  # Hex digits of the random part of a journal name
+INSERT_JOURNALED_LEDGER_SQL = """INSERT OR IGNORE INTO ledger
+                                 (user_id, product, amount, category, date, row_hash)
+                                 VALUES (?, ?, ?, ?, ?, ?)"""
+
+
+@contextmanager
+def file_lock(path):
+    # Exclusive lock on a sidecar file, shared by all server processes
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def process_umask():
+    # Linux reports the umask in /proc. Elsewhere it can only be read by
+    # setting it, which briefly affects files other threads create
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+UMASK = process_umask()
+
+
+def file_mode(path):
+    # Permission bits for path: its current ones, or what open() would give
+    # a new file under the process umask
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+def atomic_write(path, data):
+    # Write to a temp file in the same directory, fsync it and rename it over
+    # the target, so readers see either the old or the new file, never half
+    directory = os.path.dirname(os.path.abspath(path))
+    with file_lock(path):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            # mkstemp creates the file 0600; keep the target's permissions
+            os.chmod(tmp_path, file_mode(path))
+            with os.fdopen(fd, "w", newline="") as tmp_file:
+                tmp_file.write(data)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if hasattr(os, "O_DIRECTORY"):
+            # Persist the rename itself
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+
+def file_signature(path):
+    # [mtime_ns, size] of path, or None if it does not exist
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def journal_row_hash(op_id, position):
+    # Stable per journal entry, so a replayed insert hits idx_ledger_user_hash
+    digest = hashlib.blake2b(f"{op_id}:{position}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class WriteBehindError(Exception):
+    pass
+
+
+def read_journal(path):
+    # Operations in a journal file, up to a torn final line left by a crash
+    ops = []
+    with open(path, encoding="utf-8") as journal:
+        for line in journal:
+            try:
+                ops.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return ops
+
+
+def lock_exclusively(path):
+    # Open file object holding a non-blocking exclusive lock on path, or
+    # None if another process holds it
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class WriteBehindQueue:
+    # Persists ledger inserts and CSV writes on a background thread. Each
+    # operation is appended to a journal before it is acknowledged; the
+    # writer rotates the journal aside, applies the batch and deletes it, so
+    # whatever a crash leaves behind is replayed on the next start (CSV
+    # writes only if their file has not changed since).
+    # Every queue (one per server process) has its own journal,
+    # "<prefix>.<pid>-<tag>", and holds a lock on "<journal>.lock" for its
+    # lifetime. A journal whose lock is free belongs to a process that died,
+    # and is adopted by the next queue to start.
+    def __init__(
+        self,
+        pool,
+        journal_prefix,
+        max_lag=WRITE_BEHIND_MAX_LAG,
+        max_attempts=WRITE_BEHIND_MAX_ATTEMPTS,
+    ):
+        self.pool = pool
+        self.journal_prefix = journal_prefix
+        self.journal_path = (
+            f"{journal_prefix}.{os.getpid()}-{uuid.uuid4().hex[:JOURNAL_TAG_LENGTH]}"
+        )
+        self.flushing_path = f"{self.journal_path}.flushing"
+        self.lock_path = f"{self.journal_path}.lock"
+        self.rejected_path = f"{journal_prefix}.rejected"
+        self.max_lag = max_lag
+        self.max_attempts = max_attempts
+        self.error = None  # Last failure, for flush() to report
+        self._pending = []
+        self._attempts = {}
+        self._submitted = 0
+        self._applied = 0
+        self._failures = 0
+        self._flush_requested = False
+        self._closed = False
+        self._changed = threading.Condition()
+        self._lock_file = self._take_journal_lock()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._adopt_orphans()
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, kind, **op):
+        op = {"id": uuid.uuid4().hex, "kind": kind, **op}
+        if kind == "csv":
+            # The file as this write found it, checked if the op is adopted
+            op["base"] = file_signature(op["path"])
+        with self._changed:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._append(op)
+            self._changed.notify_all()
+
+    def flush(self, timeout=WRITE_BEHIND_FLUSH_TIMEOUT):
+        # Block until everything submitted so far is persisted. Raises
+        # WriteBehindError as soon as a batch fails, or after timeout seconds
+        with self._changed:
+            target = self._submitted
+            failures = self._failures
+            self._flush_requested = True
+            self._changed.notify_all()
+            self._changed.wait_for(
+                lambda: self._applied >= target or self._failures > failures, timeout
+            )
+            if self._applied >= target:
+                return
+            if self._failures > failures:
+                raise WriteBehindError(f"saving changes failed: {self.error}")
+            raise WriteBehindError(f"saving changes took longer than {timeout:g}s")
+
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
+        self._journal.close()
+        # Anything still unapplied stays on disk; releasing the lock below
+        # lets the next queue to start adopt it
+        if (
+            not self._pending
+            and not os.path.exists(self.flushing_path)
+            and os.path.getsize(self.journal_path) == 0
+        ):
+            os.remove(self.journal_path)
+            if self._lock_file is not None:
+                os.remove(self.lock_path)
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def _append(self, op):
+        # Handed to the OS before acknowledging; fsync is left to the writer.
+        # Called with self._changed held
+        self._journal.write(json.dumps(op, default=str) + "\n")
+        self._journal.flush()
+        self._pending.append(op)
+        self._submitted += 1
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                # Give later mutations a moment to join the batch
+                self._changed.wait_for(
+                    lambda: self._closed or self._flush_requested, self.max_lag
+                )
+                ops, self._pending = self._pending, []
+                self._flush_requested = False
+                try:
+                    self._rotate_journal()
+                    error = None
+                except OSError as e:
+                    error = e
+            if error is None:
+                retry, error = self._apply_batch(ops)
+            else:
+                retry = ops
+            if error is None:
+                try:
+                    os.remove(self.flushing_path)
+                except OSError:
+                    pass  # Rotated into again next round; replaying it is harmless
+            with self._changed:
+                self._applied += len(ops) - len(retry)
+                if error is not None:
+                    self.error = error
+                    self._failures += 1
+                self._changed.notify_all()
+                if not retry:
+                    continue
+                # Keep the rotated journal and retry on the next round, or
+                # leave it for the next start if we are shutting down
+                if self._closed:
+                    return
+                self._pending[:0] = retry
+            time.sleep(self.max_lag)
+
+    def _apply_batch(self, ops):
+        # (ops to retry, last error). A failed batch is retried one op at a
+        # time, so one bad op cannot hold back the rest; an op that fails
+        # max_attempts times is set aside in the rejected file
+        try:
+            self._apply(ops)
+            return [], None
+        except Exception as e:
+            error = e
+        retry = []
+        for op in ops:
+            try:
+                self._apply([op])
+                self._attempts.pop(op["id"], None)
+                continue
+            except Exception as e:
+                error = e
+            attempts = self._attempts[op["id"]] = self._attempts.get(op["id"], 0) + 1
+            if attempts < self.max_attempts:
+                retry.append(op)
+                continue
+            try:
+                self._reject(op, error)
+                del self._attempts[op["id"]]
+            except OSError:
+                retry.append(op)
+        # A batch that only failed as a whole (a transient error) is not a
+        # failure worth reporting once every op went through on its own
+        if not retry and not any(op["id"] in self._attempts for op in ops):
+            return [], None
+        return retry, error
+
+    def _reject(self, op, error):
+        line = json.dumps({**op, "error": repr(error)}, default=str)
+        with file_lock(self.rejected_path):
+            with open(self.rejected_path, "a", encoding="utf-8") as rejected:
+                rejected.write(line + "\n")
+
+    def _rotate_journal(self):
+        self._journal.close()
+        try:
+            if os.path.exists(self.flushing_path):
+                # A failed batch is still pending; keep its entries in front
+                with open(self.journal_path, encoding="utf-8") as src, open(
+                    self.flushing_path, "a", encoding="utf-8"
+                ) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.flushing_path)
+        finally:
+            # Reopened even on failure, so submit() keeps journaling
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _take_journal_lock(self):
+        if fcntl is None:
+            return None
+        # Locked under a temporary name and renamed into place, so no other
+        # process can ever see this journal's lock file unlocked
+        directory = os.path.dirname(os.path.abspath(self.lock_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".lock")
+        lock_file = os.fdopen(fd, "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        os.replace(tmp_path, self.lock_path)
+        return lock_file
+
+    def _orphaned_journals(self):
+        # Journals under journal_prefix whose owner is gone. Without fcntl a
+        # live journal cannot be told from an orphan, so only the single
+        # journal of versions before per-process journals is adopted
+        directory = os.path.dirname(os.path.abspath(self.journal_prefix))
+        name = os.path.basename(self.journal_prefix)
+        own = re.compile(rf"{re.escape(name)}\.\d+-[0-9a-f]{{{JOURNAL_TAG_LENGTH}}}")
+        journals = {name}
+        if fcntl is not None:
+            for entry in os.listdir(directory):
+                base = entry.removesuffix(".flushing")
+                if own.fullmatch(base):
+                    journals.add(base)
+        journals.discard(os.path.basename(self.journal_path))
+        return [os.path.join(directory, journal) for journal in sorted(journals)]
+
+    def _adopt_orphans(self):
+        # Moves the operations of dead processes' journals into this queue.
+        # The prefix lock stops two starting queues adopting the same one
+        with file_lock(self.journal_prefix):
+            for journal in self._orphaned_journals():
+                lock_file = None
+                if journal != self.journal_prefix:
+                    lock_file = lock_exclusively(f"{journal}.lock")
+                    if lock_file is None:
+                        continue  # Owner is alive
+                paths = [f"{journal}.flushing", journal]
+                paths = [path for path in paths if os.path.exists(path)]
+                ops = [op for path in paths for op in read_journal(path)]
+                stale = self._stale_csv_writes(ops)
+                for op in ops:
+                    if stale.get(op["id"]) is not None:
+                        self._reject(op, stale[op["id"]])
+                with self._changed:
+                    for op in ops:
+                        if op["id"] not in stale:
+                            self._append(op)
+                for path in paths:
+                    os.remove(path)
+                if lock_file is not None:
+                    os.remove(f"{journal}.lock")
+                    lock_file.close()
+
+    def _stale_csv_writes(self, ops):
+        # {op id: error, or None to drop it} for the CSV writes of a dead
+        # process that must not be replayed. Another process may have saved
+        # the file since, so the writes to a file are replayed only while it
+        # is still as one of them found it. Writes that had already reached
+        # the file before the crash are dropped; the rest are set aside.
+        # Ledger inserts are idempotent and always replayed
+        writes = {}
+        for op in ops:
+            if op["kind"] == "csv":
+                writes.setdefault(op["path"], []).append(op)
+        stale = {}
+        for path, path_ops in writes.items():
+            current = file_signature(path)
+            if any(op.get("base", False) == current for op in path_ops):
+                continue
+            try:
+                with open(path, newline="") as file:
+                    written = file.read() == path_ops[-1]["data"]
+            except (OSError, UnicodeDecodeError):
+                written = False
+            error = None if written else WriteBehindError(f"{path} changed after the write was queued")
+            stale.update((op["id"], error) for op in path_ops)
+        return stale
+
+    def _apply(self, ops):
+        rows = [
+            (*row, journal_row_hash(op["id"], position))
+            for op in ops
+            if op["kind"] == "ledger"
+            for position, row in enumerate(op["rows"])
+        ]
+        if rows:
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.executemany(INSERT_JOURNALED_LEDGER_SQL, rows)
+        # Later writes to the same file supersede earlier ones
+        files = {op["path"]: op["data"] for op in ops if op["kind"] == "csv"}
+        for path, data in files.items():
+            atomic_write(path, data)
@@ -0,0 +1,110 @@
+# On-disk cache of fitted statsmodels results for
+# US_TV_seasons_by_year_Streamlit.py. Entries are content-addressed by the
+# series, the model type and its order, so every server process and worker
+# sharing the directory reuses the same fit, and a changed series simply
+# gets a new entry. Entries for old series are evicted least recently used
+# first once the directory outgrows its byte budget.
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import statsmodels
+from statsmodels.tsa.arima.model import ARIMA
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from arima_selection import NO_SEASON
+
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache")
+MODEL_CACHE_MAX_BYTES = 512 * 1024 * 1024  # A fitted model pickles to ~0.2-0.5 MB
+MODEL_TYPES = {"ARIMA": ARIMA, "SARIMAX": SARIMAX}
+
+
+def cache_key(endog, order, model_type, seasonal_order=NO_SEASON):
+    # Values and index of the series, the model and its orders. The
+    # statsmodels version is included because results are pickled
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(np.asarray(endog, dtype="float64").tobytes())
+    digest.update(repr(list(getattr(endog, "index", []))).encode())
+    digest.update(
+        repr(
+            (model_type, tuple(order), tuple(seasonal_order), statsmodels.__version__)
+        ).encode()
+    )
+    return digest.hexdigest()
+
+
+def cache_path(key, cache_dir=MODEL_CACHE_DIR):
+    # Fan out over subdirectories so no single directory grows too large
+    return os.path.join(cache_dir, key[:2], f"{key}.pickle")
+
+
+def prune(cache_dir=MODEL_CACHE_DIR, max_bytes=MODEL_CACHE_MAX_BYTES):
+    # Delete the least recently used entries until the cache fits in
+    # max_bytes. Loads bump an entry's mtime, so mtime order is LRU order.
+    # Other processes may prune at the same time; files they removed first
+    # are skipped
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith(".pickle"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def load_or_fit(
+    endog,
+    order,
+    model_type="ARIMA",
+    cache_dir=MODEL_CACHE_DIR,
+    seasonal_order=NO_SEASON,
+    max_bytes=MODEL_CACHE_MAX_BYTES,
+):
+    # Fitted results for endog, loaded from the cache or fitted and stored
+    path = cache_path(cache_key(endog, order, model_type, seasonal_order), cache_dir)
+    try:
+        with open(path, "rb") as f:
+            results = pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass  # Truncated or written by an incompatible version; refit below
+    else:
+        try:
+            os.utime(path)  # Mark as recently used for prune()
+        except FileNotFoundError:
+            pass  # Pruned by another process since we opened it
+        return results
+
+    results = MODEL_TYPES[model_type](
+        endog, order=order, seasonal_order=seasonal_order
+    ).fit()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file and rename, so concurrent readers never see
+    # a partial pickle; concurrent writers of the same key write the same fit
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    prune(cache_dir, max_bytes)
+    return results